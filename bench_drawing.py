@@ -0,0 +1,80 @@
+"""
+Benchmark of building and painting part view scenes against number of holes.
+Compares one QGraphicsEllipseItem per hole with a single HolesItem path per surface.
+Runs without display, e.g. python bench_drawing.py > bench_output.txt
+"""
+import os
+import sys
+import time
+import random
+
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt6.QtWidgets import QApplication, QGraphicsScene, QGraphicsEllipseItem
+from PyQt6.QtGui import QImage, QPainter, QPen
+from PyQt6.QtCore import Qt, QRectF
+
+from main import HolesItem
+
+
+HOLE_COUNTS = (100, 1000, 10000)
+# Rendered view size in pixels and view scales in pixels per mm*10
+VIEW_WIDTH = 1000
+VIEW_HEIGHT = 300
+SCALE = 0.05
+ZOOMED_OUT_SCALE = 0.005
+# Hole diameter in mm*10
+HOLE_DIAMETER = 206
+REPEATS = 3
+
+
+def build_items_scene(hole_rects, pen):
+    scene = QGraphicsScene()
+    for hole_rect in hole_rects:
+        ellipse = QGraphicsEllipseItem(*hole_rect)
+        ellipse.setPen(pen)
+        scene.addItem(ellipse)
+    return scene
+
+
+def build_path_scene(hole_rects, pen):
+    scene = QGraphicsScene()
+    scene.addItem(HolesItem(hole_rects, pen))
+    return scene
+
+
+def render(scene, scale):
+    """Return time in seconds of painting scene into image of view size at given scale"""
+    image = QImage(VIEW_WIDTH, VIEW_HEIGHT, QImage.Format.Format_RGB32)
+    painter = QPainter(image)
+    start_time = time.perf_counter()
+    scene.render(painter, QRectF(0, 0, VIEW_WIDTH, VIEW_HEIGHT), QRectF(0, 0, VIEW_WIDTH/scale, VIEW_HEIGHT/scale))
+    painter.end()
+    return time.perf_counter() - start_time
+
+
+def main():
+    app = QApplication(sys.argv)
+    pen = QPen(Qt.GlobalColor.white)
+    pen.setCosmetic(True)
+    random.seed(0)
+
+    print("holes  scene  build ms  paint ms  paint zoomed out ms")
+    for hole_count in HOLE_COUNTS:
+        hole_rects = [
+            (random.uniform(0, VIEW_WIDTH/SCALE), random.uniform(0, VIEW_HEIGHT/SCALE), HOLE_DIAMETER, HOLE_DIAMETER)
+            for i in range(hole_count)
+            ]
+        for name, build_scene in (("items", build_items_scene), ("path", build_path_scene)):
+            start_time = time.perf_counter()
+            scene = build_scene(hole_rects, pen)
+            build_time = time.perf_counter() - start_time
+            # First paint fills caches of the scene
+            render(scene, SCALE)
+            paint_time = min(render(scene, SCALE) for i in range(REPEATS))
+            zoomed_out_time = min(render(scene, ZOOMED_OUT_SCALE) for i in range(REPEATS))
+            print(f"{hole_count:5d}  {name:5s}  {build_time*1000:8.1f}  {paint_time*1000:8.1f}  {zoomed_out_time*1000:19.1f}")
+    app.quit()
+
+if __name__ == "__main__":
+    main()
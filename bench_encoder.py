@@ -0,0 +1,52 @@
+"""
+Benchmark of PeddimatEncoder.encode_part against number of holes, without database.
+Synthetic parts are a sample part with random holes of a few sizes, e.g. python bench_encoder.py > bench_output.txt
+"""
+import os
+import time
+import random
+
+from db_controller import decoded_part_data
+from dstv_decoder import SteelPart, HoleTable
+from peddimat_encoder import PeddimatEncoder
+
+
+HOLE_COUNTS = (1000, 10000, 100000)
+SAMPLE_PATH = os.path.join(os.path.dirname(__file__), "sample_dstv_files", "1001B.nc1")
+# Hole diameters in mm, few sizes as on real parts so every hole has a tool slot
+DIAMETERS = ("14.00", "18.00", "22.00", "26.00")
+REPEATS = 3
+
+
+def random_holes_lines(hole_count, part):
+    """Return BO rows of random holes within part length and profile depth"""
+    holes_lines = []
+    for i in range(hole_count):
+        surface = random.choice("ovu")
+        x_distance = f"{random.uniform(0, part.length/10):.2f}s"
+        y_distance = f"{random.uniform(0, part.profile_depth/10):.2f}"
+        holes_lines.append([surface, x_distance, y_distance, random.choice(DIAMETERS)])
+    return holes_lines
+
+
+def synthetic_part_data(hole_count):
+    part = SteelPart(SAMPLE_PATH)
+    part._holes = HoleTable(part, random_holes_lines(hole_count, part))
+    return decoded_part_data(part)
+
+
+def main():
+    random.seed(0)
+    encoder = PeddimatEncoder(None)
+    print("holes  encode_part ms  us per hole")
+    for hole_count in HOLE_COUNTS:
+        part_data = synthetic_part_data(hole_count)
+        encode_time = float("inf")
+        for i in range(REPEATS):
+            start_time = time.perf_counter()
+            encoder.encode_part(part_data)
+            encode_time = min(encode_time, time.perf_counter() - start_time)
+        print(f"{hole_count:6d}  {encode_time*1000:14.1f}  {encode_time*1e6/hole_count:11.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,213 @@
 import sqlite3
 import os
-from dstv_decoder import SteelPart
+import time
+import pickle
+import threading
+import json
+from itertools import groupby, chain
+from collections import deque
+from operator import itemgetter
+from contextlib import contextmanager
+from dstv_decoder import SteelPart, DECODER_VERSION, decode_many
+
+
+# Pragmas applied to every new connection, cache_size in negative KiB
+DEFAULT_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "cache_size": -16000,
+    "temp_store": "MEMORY",
+    "foreign_keys": "ON",
+    }
+
+
+# Version of part and hole tables stored in database user_version pragma
+SCHEMA_VERSION = 3
+
+# Part with already imported partmark is updated in place and keeps its PartId
+PART_INSERT_QUERY = """INSERT INTO part (
+partmark,
+profile,
+profile_type,
+quantity,
+profile_depth,
+web_thickness,
+flange_height,
+flange_thickness,
+length,
+content_hash
+)
+VALUES (?,?,?,?,?,?,?,?,?,?)
+ON CONFLICT (partmark) DO UPDATE SET
+profile = excluded.profile,
+profile_type = excluded.profile_type,
+quantity = excluded.quantity,
+profile_depth = excluded.profile_depth,
+web_thickness = excluded.web_thickness,
+flange_height = excluded.flange_height,
+flange_thickness = excluded.flange_thickness,
+length = excluded.length,
+content_hash = excluded.content_hash
+RETURNING PartId;"""
+
+HOLE_INSERT_QUERY = """INSERT INTO hole (
+PartId,
+surface,
+diameter,
+slotted,
+slot_x,
+slot_y,
+size,
+size_mm,
+size_inch,
+x_distance,
+y_distance
+)
+VALUES (?,?,?,?,?,?,?,?,?,?,?);"""
+
+
+def part_row(part):
+    return (
+        part.partmark,
+        part.profile,
+        part.profile_type,
+        part.quantity,
+        round(part.profile_depth),
+        round(part.web_thickness),
+        round(part.flange_height),
+        round(part.flange_thickness),
+        round(part.length),
+        getattr(part, "content_hash", None)
+        )
+
+
+def hole_row(part_id, hole):
+    return (
+        part_id,
+        hole.surface,
+        round(hole.diameter),
+        hole.slotted,
+        round(hole.slot_x),
+        round(hole.slot_y),
+        hole.size,
+        hole.size_mm,
+        hole.size_inch,
+        round(hole.x_distance),
+        round(hole.y_distance)
+        )
+
+
+PART_DATA_COLUMNS = (
+    "partmark", "profile", "profile_type", "quantity", "profile_depth",
+    "web_thickness", "flange_height", "flange_thickness", "length"
+    )
+HOLE_DATA_COLUMNS = (
+    "surface", "diameter", "slotted", "slot_x", "slot_y",
+    "size", "size_mm", "size_inch", "x_distance", "y_distance"
+    )
+
+
+def iter_part_holes(part):
+    """Return holes of decoded part, streamed from memory-mapped DSTV file when part is a SteelPart"""
+    iter_holes = getattr(part, "iter_holes", None)
+    return iter_holes() if iter_holes else part.holes
+
+
+def decoded_part_data(part):
+    """
+    Return part data dictionary of decoded part shaped like PartDatabase.iter_parts result,
+    with values rounded the same way as when written to database.
+    """
+    data = dict(zip(PART_DATA_COLUMNS, part_row(part)))
+    data["holes"] = [dict(zip(HOLE_DATA_COLUMNS, hole_row(None, hole)[1:])) for hole in iter_part_holes(part)]
+    # slotted column has text affinity, boolean is read back as "0" or "1"
+    for hole in data["holes"]:
+        hole["slotted"] = str(int(hole["slotted"]))
+    return data
+
+
+# Session database kept in memory, shared by connections of all threads while any of them is open
+MEMORY_SESSION_URI = "file:current_session?mode=memory&cache=shared"
 
 
 class DatabaseConnection:
-    def __init__(self, database_file="database.db"):
+    """
+    Owns one long-lived SQLite connection per thread for given database file.
+    database_file can also be SQLite URI, e.g. MEMORY_SESSION_URI.
+    With count_statements SQL statements run by connections are counted in statements_executed,
+    each row of executemany counts as a statement; the trace callback slows down bulk inserts, so it is off by default.
+    """
+    def __init__(self, database_file="database.db", pragmas=None, count_statements=False):
         self.database_file = database_file
+        self.pragmas = dict(DEFAULT_PRAGMAS, **(pragmas or {}))
+        self.count_statements = count_statements
+        self.local = threading.local()
+        self.lock = threading.Lock()
+        self.connections = []
+        self.connections_opened = 0
+        self.statements_executed = 0
     
     def delete_old(self):
-        if os.path.exists(self.database_file):
-            os.remove(self.database_file)
+        self.close()
+        for path in (self.database_file, self.database_file + "-wal", self.database_file + "-shm"):
+            if os.path.exists(path):
+                os.remove(path)
     
     def connect(self):
-        connection = sqlite3.connect(self.database_file)
+        connection = getattr(self.local, "connection", None)
+        if connection is None:
+            # Connection is only used by its thread, other threads may only close it
+            uri = self.database_file.startswith("file:")
+            connection = sqlite3.connect(self.database_file, check_same_thread=False, uri=uri)
+            for name, value in self.pragmas.items():
+                connection.execute(f"PRAGMA {name} = {value}")
+            if self.count_statements:
+                connection.set_trace_callback(self.count_statement)
+            self.local.connection = connection
+            with self.lock:
+                self.connections.append(connection)
+                self.connections_opened += 1
         return connection
 
+    @contextmanager
+    def transaction(self):
+        """Yield connection of current thread, commit on success and roll back on exception"""
+        connection = self.connect()
+        with connection:
+            yield connection
+
+    def save_snapshot(self, path):
+        """Copy whole database to file at given path with SQLite backup API"""
+        target = sqlite3.connect(path)
+        self.connect().backup(target)
+        target.close()
+
+    def load_snapshot(self, path):
+        """Replace database content with content of database file at given path"""
+        source = sqlite3.connect(path)
+        source.backup(self.connect())
+        source.close()
+
+    def count_statement(self, statement):
+        self.statements_executed += 1
+
+    def close_thread_connection(self):
+        """Close connection of current thread, e.g. before worker thread finishes"""
+        connection = getattr(self.local, "connection", None)
+        if connection is not None:
+            with self.lock:
+                self.connections.remove(connection)
+            connection.close()
+            self.local.connection = None
+
+    def close(self):
+        """Close connections of all threads"""
+        with self.lock:
+            for connection in self.connections:
+                connection.close()
+            self.connections = []
+        self.local = threading.local()
+
 
 class PartDatabase:
     def __init__(self, database_connection):
@@ -34,44 +227,37 @@ class PartDatabase:
         web_thickness integer,
         flange_height integer,
         flange_thickness integer,
-        length integer
+        length integer,
+        content_hash text
         );"""
 
         cursor.execute(query)
+        cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS part_partmark ON part (partmark);")
         cursor.close()
-        connection.close()
     
     def insert_data(self, part):
         connection = self.database_connection.connect()
         cursor = connection.cursor()
-
-        query = """INSERT INTO part (
-        partmark,
-        profile,
-        profile_type,
-        quantity,
-        profile_depth,
-        web_thickness,
-        flange_height,
-        flange_thickness,
-        length
-        )
-        VALUES (?,?,?,?,?,?,?,?,?);"""
-
-        cursor.execute(query, (
-            part.partmark,
-            part.profile,
-            part.profile_type,
-            part.quantity,
-            round(part.profile_depth),
-            round(part.web_thickness),
-            round(part.flange_height),
-            round(part.flange_thickness),
-            round(part.length)
-            ))
+        cursor.execute(PART_INSERT_QUERY, part_row(part))
+        cursor.fetchone()
         connection.commit()
         cursor.close()
-        connection.close()
+
+    def insert_parts(self, parts):
+        """
+        Insert or update parts and replace their holes in a single transaction.
+        Return list of written partmarks.
+        """
+        partmarks = []
+        with self.database_connection.transaction() as connection:
+            cursor = connection.cursor()
+            for part in parts:
+                part_id = cursor.execute(PART_INSERT_QUERY, part_row(part)).fetchone()[0]
+                cursor.execute("DELETE FROM hole WHERE PartId = ?", (part_id,))
+                cursor.executemany(HOLE_INSERT_QUERY, (hole_row(part_id, hole) for hole in iter_part_holes(part)))
+                partmarks.append(part.partmark)
+            cursor.close()
+        return partmarks
     
     def remove_data(self, partmark):
         connection = self.database_connection.connect()
@@ -79,18 +265,30 @@ class PartDatabase:
         cursor.execute("DELETE FROM part WHERE partmark = ?", (partmark,))
         connection.commit()
         cursor.close()
-        connection.close()
     
     def get_partmarks_list(self):
         connection = self.database_connection.connect()
         cursor = connection.cursor()
-        result = cursor.execute("SELECT partmark FROM part")
+        result = cursor.execute("SELECT partmark FROM part ORDER BY PartId")
         return [item[0] for item in result]
 
+    def get_content_hashes(self):
+        connection = self.database_connection.connect()
+        cursor = connection.cursor()
+        result = cursor.execute("SELECT content_hash FROM part WHERE content_hash IS NOT NULL")
+        return {item[0] for item in result}
+
+    def get_source_hashes(self):
+        """Return dictionary from partmark to content hash of its DSTV file, None for parts imported without hash"""
+        connection = self.database_connection.connect()
+        cursor = connection.cursor()
+        result = cursor.execute("SELECT partmark, content_hash FROM part")
+        return dict(result.fetchall())
+
     def get_part_geometry(self, partmark):
         connection = self.database_connection.connect()
-        connection.row_factory = sqlite3.Row
         cursor = connection.cursor()
+        cursor.row_factory = sqlite3.Row
 
         query = """SELECT
         profile,
@@ -106,6 +304,60 @@ class PartDatabase:
         result = cursor.fetchone()
         return dict(result)
 
+    def iter_parts(self, partmarks=None):
+        """
+        Yield part data dictionaries with list of hole data dictionaries under "holes" key,
+        for given partmarks or all parts, loaded with a single ordered join.
+        """
+        connection = self.database_connection.connect()
+        cursor = connection.cursor()
+
+        query = """SELECT
+        part.PartId,
+        part.partmark,
+        part.profile,
+        part.profile_type,
+        part.quantity,
+        part.profile_depth,
+        part.web_thickness,
+        part.flange_height,
+        part.flange_thickness,
+        part.length,
+        hole.HoleId,
+        hole.surface,
+        hole.diameter,
+        hole.slotted,
+        hole.slot_x,
+        hole.slot_y,
+        hole.size,
+        hole.size_mm,
+        hole.size_inch,
+        hole.x_distance,
+        hole.y_distance
+        FROM part LEFT JOIN hole ON hole.PartId = part.PartId"""
+
+        if partmarks is None:
+            cursor.execute(query + " ORDER BY part.PartId, hole.HoleId")
+        else:
+            query += " WHERE part.partmark IN (SELECT value FROM json_each(?)) ORDER BY part.PartId, hole.HoleId"
+            cursor.execute(query, (json.dumps(list(partmarks)),))
+
+        part_columns = [column[0] for column in cursor.description[1:10]]
+        hole_columns = [column[0] for column in cursor.description[11:]]
+        for part_id, rows in groupby(cursor, key=itemgetter(0)):
+            first_row = next(rows)
+            part_data = dict(zip(part_columns, first_row[1:10]))
+            part_data["holes"] = []
+            # Part without holes is joined with single row of NULL hole columns
+            if first_row[10] is not None:
+                part_data["holes"] = [dict(zip(hole_columns, row[11:])) for row in chain((first_row,), rows)]
+            yield part_data
+        cursor.close()
+
+    def load_parts(self, partmarks=None):
+        """Return list of part data dictionaries, see iter_parts"""
+        return list(self.iter_parts(partmarks))
+
 
 class HoleDatabase:
     def __init__(self, database_connection):
@@ -126,7 +378,7 @@ class HoleDatabase:
 
         query = """CREATE TABLE IF NOT EXISTS hole (
         HoleId integer PRIMARY KEY,
-        PartId integer,
+        PartId integer REFERENCES part (PartId) ON DELETE CASCADE,
         surface text,
         diameter integer,
         slotted text,
@@ -140,45 +392,16 @@ class HoleDatabase:
         );"""
 
         cursor.execute(query)
+        cursor.execute("CREATE INDEX IF NOT EXISTS hole_part_surface ON hole (PartId, surface);")
         cursor.close()
-        connection.close()
     
     def insert_data(self, hole):
         connection = self.database_connection.connect()
         cursor = connection.cursor()
         part_id = self.get_part_id(hole=hole)
-
-        query = """INSERT INTO hole (
-        PartId,
-        surface,
-        diameter,
-        slotted,
-        slot_x,
-        slot_y,
-        size,
-        size_mm,
-        size_inch,
-        x_distance,
-        y_distance
-        )
-        VALUES (?,?,?,?,?,?,?,?,?,?,?);"""
-
-        cursor.execute(query, (
-            part_id,
-            hole.surface,
-            round(hole.diameter),
-            hole.slotted,
-            round(hole.slot_x),
-            round(hole.slot_y),
-            hole.size,
-            hole.size_mm,
-            hole.size_inch,
-            round(hole.x_distance),
-            round(hole.y_distance)
-            ))
+        cursor.execute(HOLE_INSERT_QUERY, hole_row(part_id, hole))
         connection.commit()
         cursor.close()
-        connection.close()
     
     def remove_data(self, partmark):
         connection = self.database_connection.connect()
@@ -187,38 +410,172 @@ class HoleDatabase:
         cursor.execute("DELETE FROM hole WHERE PartId = ?", (part_id,))
         connection.commit()
         cursor.close()
-        connection.close()
-    
-    def get_hole_info_list(self, partmark):
+
+
+def migrate_schema(database_connection):
+    """Create part and hole tables or upgrade tables of older session database to SCHEMA_VERSION"""
+    part_database = PartDatabase(database_connection)
+    hole_database = HoleDatabase(database_connection)
+    with database_connection.transaction() as connection:
+        cursor = connection.cursor()
+        version = cursor.execute("PRAGMA user_version").fetchone()[0]
+        tables = [row[0] for row in cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table'")]
+
+        if version < 2 and "part" in tables:
+            # Unique partmark index needs single part per partmark, the first imported one is kept
+            cursor.execute("DELETE FROM part WHERE PartId NOT IN (SELECT MIN(PartId) FROM part GROUP BY partmark)")
+        if version < 3 and "part" in tables:
+            cursor.execute("ALTER TABLE part ADD COLUMN content_hash text")
+        if version < 2 and "hole" in tables:
+            # Foreign key can not be added to existing table, holes are copied to recreated table
+            cursor.execute("ALTER TABLE hole RENAME TO hole_old")
+
+        part_database.create_table()
+        hole_database.create_table()
+
+        if version < 2 and "hole" in tables:
+            cursor.execute("INSERT INTO hole SELECT * FROM hole_old WHERE PartId IN (SELECT PartId FROM part)")
+            cursor.execute("DROP TABLE hole_old")
+        cursor.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        cursor.close()
+
+
+class ParseCache:
+    """On-disk cache of decoded DSTV files keyed by file stat with content hash fallback"""
+    def __init__(self, database_connection, max_bytes=256*1024*1024):
+        self.database_connection = database_connection
+        self.max_bytes = max_bytes
+
+    def create_table(self):
         connection = self.database_connection.connect()
-        connection.row_factory = sqlite3.Row
         cursor = connection.cursor()
-        part_id = self.get_part_id(partmark=partmark)
 
-        query = """SELECT
-        surface,
-        size_mm,
-        size_inch,
-        x_distance,
-        y_distance
-        FROM hole WHERE PartId = ?"""     
-        cursor.execute(query, (part_id, ))
-        return cursor.fetchall()
-    
-    def get_hole_geometry_list(self, partmark, surface):
+        cursor.execute("CREATE TABLE IF NOT EXISTS meta (name text PRIMARY KEY, value text);")
+        cursor.execute("""CREATE TABLE IF NOT EXISTS entry (
+        hash text PRIMARY KEY,
+        record blob,
+        nbytes integer,
+        last_used real
+        );""")
+        cursor.execute("""CREATE TABLE IF NOT EXISTS file (
+        path text PRIMARY KEY,
+        size integer,
+        mtime integer,
+        hash text
+        );""")
+
+        # Entries decoded with different decoder rules are invalid
+        cursor.execute("SELECT value FROM meta WHERE name = 'decoder_version'")
+        row = cursor.fetchone()
+        if not row or row[0] != str(DECODER_VERSION):
+            cursor.execute("DELETE FROM entry")
+            cursor.execute("DELETE FROM file")
+            cursor.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('decoder_version', ?)", (str(DECODER_VERSION),))
+        connection.commit()
+        cursor.close()
+
+    def get_hash(self, cursor, path, stat):
+        """Return content hash of file recorded with the same size and mtime, None if the file is not known"""
+        cursor.execute("SELECT hash FROM file WHERE path = ? AND size = ? AND mtime = ?", (path, stat.st_size, stat.st_mtime_ns))
+        row = cursor.fetchone()
+        return row[0] if row else None
+
+    def set_hash(self, cursor, path, stat, content_hash):
+        cursor.execute("INSERT OR REPLACE INTO file (path, size, mtime, hash) VALUES (?,?,?,?)", (path, stat.st_size, stat.st_mtime_ns, content_hash))
+
+    def lookup(self, cursor, path, content_hash):
+        cursor.execute("SELECT record FROM entry WHERE hash = ?", (content_hash,))
+        row = cursor.fetchone()
+        if not row:
+            return None
+        cursor.execute("UPDATE entry SET last_used = ? WHERE hash = ?", (time.time(), content_hash))
+        record = pickle.loads(row[0])
+        record.path = path
+        return record
+
+    def store(self, cursor, content_hash, record):
+        data = pickle.dumps(record, pickle.HIGHEST_PROTOCOL)
+        cursor.execute("INSERT OR REPLACE INTO entry (hash, record, nbytes, last_used) VALUES (?,?,?,?)", (content_hash, data, len(data), time.time()))
+
+    def evict(self, cursor):
+        cursor.execute("SELECT SUM(nbytes) FROM entry")
+        total = cursor.fetchone()[0] or 0
+        if total <= self.max_bytes:
+            return
+        # Drop least recently used entries until the cache fits its size limit
+        removed = []
+        for content_hash, nbytes in cursor.execute("SELECT hash, nbytes FROM entry ORDER BY last_used").fetchall():
+            if total <= self.max_bytes:
+                break
+            removed.append((content_hash,))
+            total -= nbytes
+        cursor.executemany("DELETE FROM entry WHERE hash = ?", removed)
+        cursor.execute("DELETE FROM file WHERE hash NOT IN (SELECT hash FROM entry)")
+
+    def decode_many(self, paths, workers=None, profile_types=None, skip_hashes=(), chunk_size=64):
+        """
+        Yield decoded PartRecord objects with content_hash as they become available.
+        Only stat of files is looked up on this thread, cached parts are yielded as they are found and files not in cache
+        are passed on to dstv_decoder.decode_many, which hashes them from the bytes it decodes.
+        Files with content hash in skip_hashes are not decoded nor yielded.
+        """
         connection = self.database_connection.connect()
         cursor = connection.cursor()
-        part_id = self.get_part_id(partmark=partmark)
+        missing = {}
+        cached = deque()
+
+        def scan():
+            """Yield (path, cached record or None) of paths not skipped"""
+            for path in paths:
+                stat = os.stat(path)
+                content_hash = self.get_hash(cursor, path, stat)
+                if content_hash is not None and content_hash in skip_hashes:
+                    continue
+                record = self.lookup(cursor, path, content_hash) if content_hash else None
+                if not record:
+                    missing[path] = stat
+                yield path, record
+
+        def uncached(items):
+            """Yield paths of items not in cache, cached records found meanwhile wait for the consumer in cached"""
+            for path, record in items:
+                if record:
+                    cached.append(record)
+                else:
+                    yield path
+
+        try:
+            # Cached parts are yielded until more files than a single chunk are found missing, see dstv_decoder.decode_many
+            items = scan()
+            head = []
+            for path, record in items:
+                if record:
+                    yield record
+                else:
+                    head.append(path)
+                    if len(head) > chunk_size:
+                        break
+
+            records = decode_many(
+                chain(head, uncached(items)), workers, chunk_size, profile_types, with_hash=True, total=len(paths)
+                )
+            for record in records:
+                while cached:
+                    yield cached.popleft()
+                self.set_hash(cursor, record.path, missing[record.path], record.content_hash)
+                # Parts filtered out by profile type are not complete, they are decoded again next time
+                if record.holes is not None or not record.correct_dstv_format:
+                    self.store(cursor, record.content_hash, record)
+                if record.content_hash not in skip_hashes:
+                    yield record
+            while cached:
+                yield cached.popleft()
+
+            self.evict(cursor)
+        finally:
+            connection.commit()
+            cursor.close()
 
-        query = """SELECT
-        diameter,
-        slot_x,
-        slot_y,
-        x_distance,
-        y_distance
-        FROM hole WHERE PartId = ? AND surface = ?"""     
-        cursor.execute(query, (part_id, surface))
-        return cursor.fetchall()
 
 
 
@@ -248,8 +605,8 @@ def test1():
 
 def test2():
     database_connection = DatabaseConnection()
-    hole_database = HoleDatabase(database_connection)
-    print(hole_database.get_hole_info_list("1002B"))
+    part_database = PartDatabase(database_connection)
+    print(part_database.load_parts(["1002B"])[0]["holes"])
 
 def test3():
     database_connection = DatabaseConnection()
@@ -1,16 +1,179 @@
 import re
 import os
+import io
+import mmap
+import hashlib
+from array import array
+from itertools import islice, chain
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+# Increase when decoding rules change, cached decoded parts of older versions are discarded
+DECODER_VERSION = 2
+BLOCK_CODE_PATTERN = re.compile(r"[A-Z]{2}")
+# Number of ST block lines containing all part info read by SteelPart
+HEADER_LINE_COUNT = 15
+# Size of reads used to validate DSTV header before decoding the file
+PRESCAN_BYTES = 512
+# Number of BO rows decoded at once by SteelPart.iter_holes
+ITER_HOLES_CHUNK = 1024
+# DSTV profile type symbols and corresponding Peddimat profile types
+# B(Plate) and L(Angle) profile functionality to be added later
+DSTV_PROFILE_TYPES = {
+    "I": "B",
+    "U": "C",
+    "M": "T",
+    "T": "t",
+    }
+SURFACE_CODES = ("o", "v", "u")
+HOLE_TYPES = ("std", "r_thrd", "l_thrd", "mark")
+
+
+class DstvBlock:
+    """A class to store identifier and data rows of a single DSTV block"""
+    def __init__(self, code):
+        """
+        Parameters:
+        code : str
+            two letter block identifier (ST, AK, BO, SI, KO, IK, EN, ...)
+        """
+        self.code = code
+        self.rows = []
+
+
+def tokenize_dstv(dstv_content: str) -> tuple:
+    """
+    Split DSTV text content in a single pass into header lines and list of blocks.
+    Header lines keep their line numbers from the file (index 0 is the ST identifier).
+    Block rows are stored as lists of whitespace separated fields, comment rows are skipped.
+    """
+    header = []
+    blocks = []
+    block = None
+    for line in dstv_content.splitlines():
+        if line[:1] != " " and BLOCK_CODE_PATTERN.fullmatch(line.rstrip()):
+            code = line.rstrip()
+            if code == "ST" and not header:
+                header.append(code)
+                continue
+            if code == "EN":
+                blocks.append(DstvBlock(code))
+                break
+            block = DstvBlock(code)
+            blocks.append(block)
+        elif block is not None:
+            fields = line.split()
+            if fields and not fields[0].startswith("**"):
+                block.rows.append(fields)
+        else:
+            header.append(line)
+    return header, blocks
+
+
+def iter_block_rows(lines):
+    """Yield (block code, row fields) for data rows of all DSTV blocks following the header, comment rows are skipped"""
+    code = None
+    header = True
+    for line in lines:
+        if line[:1] != " " and BLOCK_CODE_PATTERN.fullmatch(line.rstrip()):
+            if line.rstrip() == "ST" and header:
+                continue
+            code = line.rstrip()
+            header = False
+            if code == "EN":
+                return
+        elif code is not None:
+            fields = line.split()
+            if fields and not fields[0].startswith("**"):
+                yield code, fields
+
+
+def check_dstv_header(header, path) -> bool:
+    """Check if DSTV header lines have correct items order"""
+    if len(header) < HEADER_LINE_COUNT:
+        return False
+    # Check if row 4 contain partmark
+    partmark_filename = os.path.basename(path).split(".")[0]
+    partmark_dstv = header[3].strip()
+    if partmark_filename != partmark_dstv:
+        return False
+    # Check if row 8 contain quantity of parts
+    try:
+        int(header[7].strip())
+    except ValueError:
+        return False
+    # All checks are correct
+    return True
+
+
+def prescan_dstv(path) -> str:
+    """
+    Classify DSTV file as "valid", "wrong_preset" or "unsupported_profile".
+    Only the first bytes of the file containing header lines are read.
+    """
+    with open(path, "rb", buffering=0) as f:
+        content = f.read(PRESCAN_BYTES)
+        # Header with long comment or values may not fit into the first read
+        while content.count(b"\n") < HEADER_LINE_COUNT:
+            chunk = f.read(PRESCAN_BYTES)
+            if not chunk:
+                break
+            content += chunk
+    header = tokenize_dstv(content.decode(errors="replace"))[0]
+    if not check_dstv_header(header, path):
+        return "wrong_preset"
+    if header[9].strip() not in DSTV_PROFILE_TYPES:
+        return "unsupported_profile"
+    return "valid"
+
+
+def prescan_many(paths) -> dict:
+    """Return dictionary with lists of paths classified as valid, wrong_preset and unsupported_profile"""
+    result = {"valid": [], "wrong_preset": [], "unsupported_profile": []}
+    for path in paths:
+        result[prescan_dstv(path)].append(path)
+    return result
+
+
+def prescan_directory(dir_path) -> dict:
+    """Classify all .nc1 files in directory, see prescan_many"""
+    paths = sorted(
+        entry.path for entry in os.scandir(dir_path)
+        if entry.is_file() and entry.name.lower().endswith(".nc1")
+        )
+    return prescan_many(paths)
+
+
+def hash_dstv(path, content: bytes) -> str:
+    """Return content hash of DSTV file bytes, partmark check depends on file name so it is hashed together with the content"""
+    file_hash = hashlib.blake2b(digest_size=16)
+    file_hash.update(os.path.basename(path).encode())
+    file_hash.update(content)
+    return file_hash.hexdigest()
+
 
 class SteelPart:
     """A class to store information about steel part geometry"""
-    def __init__(self, path):
+    def __init__(self, path, lazy=False, content=None):
         """
         Read all necessary infromation for the SteelPart object from DSTV file.
         Parameters:
         path : str
             path to .NC1 file
+        lazy : bool
+            read only header lines of the file, holes are decoded on first access to holes
+        content : str
+            text content of the file already read by the caller, the file is not read again
         """
-        self.dstv_content = self.get_dstv_content(path)
+        self.path = path
+        if content is not None:
+            self.dstv_content = content
+            self.header, self.blocks = tokenize_dstv(content)
+        elif lazy:
+            self.header, self.blocks = self.get_dstv_header(path), None
+        else:
+            self.dstv_content = self.get_dstv_content(path)
+            self.header, self.blocks = tokenize_dstv(self.dstv_content)
+        self._holes = None
 
         self.check_correct_dstv_format(path)
 
@@ -24,8 +187,52 @@ class SteelPart:
             self.get_flange_height()
             self.get_flange_thickness()
             self.get_length()
-            self.get_holes()
+            if not lazy:
+                self.get_holes()
     
+    @property
+    def holes(self):
+        """HoleTable of the part, in lazy mode decoded from DSTV file on first access"""
+        if self._holes is None:
+            self.get_holes()
+        return self._holes
+
+    def iter_holes(self):
+        """
+        Yield holes of the part reading BO blocks from memory-mapped DSTV file.
+        Rows are decoded in HoleTable chunks of ITER_HOLES_CHUNK holes, so memory use does not depend on number of holes.
+        Part with incorrect DSTV format has no holes.
+        """
+        if not self.correct_dstv_format:
+            return
+        if self._holes is not None:
+            yield from self._holes
+            return
+
+        with open(self.path, "rb") as f:
+            try:
+                content = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Empty file can not be mapped
+                return
+            with content:
+                lines = (line.decode(errors="replace") for line in iter(content.readline, b""))
+                holes_lines = []
+                for code, fields in iter_block_rows(lines):
+                    if code == "BO" and fields[0] in SURFACE_CODES:
+                        holes_lines.append(fields)
+                        if len(holes_lines) == ITER_HOLES_CHUNK:
+                            yield from HoleTable(self, holes_lines)
+                            holes_lines = []
+                if holes_lines:
+                    yield from HoleTable(self, holes_lines)
+
+    def get_dstv_header(self, path) -> list:
+        """Return header lines of given DSTV file without reading the rest of the file"""
+        with open(path, "r") as f:
+            header_content = "".join(islice(f, HEADER_LINE_COUNT))
+        return tokenize_dstv(header_content)[0]
+
     def get_dstv_content(self, path) -> str:
         """Return text content of given DSTV file"""
         with open(path, "r") as f:
@@ -34,87 +241,58 @@ class SteelPart:
     
     def check_correct_dstv_format(self, path):
         """Check if the DSTV file has correct items order"""
-        # Check if row 4 contain partmark
-        partmark_filename = os.path.basename(path).split(".")[0]
-        partmark_dstv = self.dstv_content.splitlines()[3].strip()
-        if partmark_filename != partmark_dstv:
-            self.correct_dstv_format = False
-            return 
-        # Check if row 8 contain quantity of parts
-        try:
-            int(self.dstv_content.splitlines()[7].strip())
-        except ValueError:
-            self.correct_dstv_format = False
-            return
-        # All checks are correct
-        self.correct_dstv_format = True
+        self.correct_dstv_format = check_dstv_header(self.header, path)
 
     def get_partmatk(self) -> None:
         """Get part mark from DSTV file text content"""
-        line = self.dstv_content.splitlines()[3]
+        line = self.header[3]
         self.partmark = line.strip()
 
     def get_profile(self) -> None:
         """Get parts profile from DSTV file text content"""
-        line = self.dstv_content.splitlines()[8]
+        line = self.header[8]
         self.profile = line.strip()
     
     def get_profile_type(self) -> None:
         """Get part profile type symbol from DSTV file text content"""
-        line = self.dstv_content.splitlines()[9]
-        self.valid_profile_type = True
-
-        profile_type_dstv = line.strip()
-        match profile_type_dstv:
-            case "I":
-                self.profile_type = "B"
-            case "U":
-                self.profile_type = "C"
-            case "M":
-                self.profile_type = "T"
-            case "T":
-                self.profile_type = "t"
-            # B(Plate) and L(Angle) profile functionality to be added later
-            # case "B":
-            # case "L":
-            case _:
-                self.profile_type = None
-                self.valid_profile_type = False
+        line = self.header[9]
+        self.profile_type = DSTV_PROFILE_TYPES.get(line.strip())
+        self.valid_profile_type = self.profile_type is not None
     
     def get_quantity(self) -> None:
         """Get quantity of parts from DSTV file text content"""
-        line = self.dstv_content.splitlines()[7]
+        line = self.header[7]
         self.quantity = int(line.strip())
     
     def get_profile_depth(self) -> None:
         """Get profile depth in mm*10 from DSTV file text content"""
         if self.profile_type == "t":
-            line = self.dstv_content.splitlines()[12]
+            line = self.header[12]
         else:
-            line = self.dstv_content.splitlines()[11]
+            line = self.header[11]
         self.profile_depth = float(line)*10
     
     def get_web_thickness(self) -> None:
         """Get profile web thickness in mm*10 from DSTV file text content"""
-        line = self.dstv_content.splitlines()[14]
+        line = self.header[14]
         self.web_thickness = float(line)*10
 
     def get_flange_height(self) -> None:
         """Get profile flange height in mm*10 from DSTV file text content"""
         if self.profile_type == "t":
-            line = self.dstv_content.splitlines()[11]
+            line = self.header[11]
         else:
-            line = self.dstv_content.splitlines()[12]
+            line = self.header[12]
         self.flange_height = float(line)*10
 
     def get_flange_thickness(self) -> None:
         """Get profile flange thickness in mm*10 from DSTV file text content"""
-        line = self.dstv_content.splitlines()[13]
+        line = self.header[13]
         self.flange_thickness = float(line)*10
 
     def get_length(self) -> None:
         """Get part length in mm*10 from DSTV file text content"""
-        line = self.dstv_content.splitlines()[10]
+        line = self.header[10]
         # Depending on DSTV export settings the line can contain single value or two values separated by comma
         # The first value is profile net length
         try:
@@ -123,115 +301,339 @@ class SteelPart:
             self.length = float(line.split(",")[0])*10
     
     def get_holes(self) -> None:
-        """Get list of part holes info"""
+        """Get table of part holes info"""
+        if self.blocks is None:
+            self.dstv_content = self.get_dstv_content(self.path)
+            self.header, self.blocks = tokenize_dstv(self.dstv_content)
         holes_lines = self.get_holes_lines()
-        self.holes = [Hole(self, line) for line in holes_lines]
+        self._holes = HoleTable(self, holes_lines)
 
     def get_holes_lines(self) -> list:
-        """Return list of lines associated with hole info from DSTV file text content"""
-        try:
-            BO_block_content = re.findall(r"(?<=BO\n)(.*)(?=EN)", self.dstv_content, re.DOTALL)[0]
-        except IndexError:
-            return []
-        holes_lines = re.findall(r"  [ovu].+", BO_block_content)
+        """Return list of BO block rows split into fields, holes on surfaces other than o, v, u are skipped"""
+        holes_lines = []
+        for block in self.blocks:
+            if block.code == "BO":
+                holes_lines.extend(row for row in block.rows if row[0] in SURFACE_CODES)
         return holes_lines
 
-class Hole:
-    """A class to store information about geometry and location of hole in SteelPart object"""
-    def __init__(self, part, hole_line_text: str):
+
+def to_micrometres(value_string: str) -> int:
+    """
+    Convert DSTV value in mm to integer micrometres.
+    Hole geometry derived from micrometres is the same as float calculation from the value string
+    for values with up to 3 decimals, values with more decimals are quantised to whole micrometres.
+    """
+    return round(float(value_string)*1000)
+
+
+class HoleTable:
+    """
+    A class to store geometry of all holes of SteelPart object as columns of integer micrometres,
+    DSTV values with more than 3 decimals are quantised, see to_micrometres
+    """
+    def __init__(self, part, holes_lines=()):
         """
-        Read all necessary infromation for the SteelPart object from DSTV file.
         Parameters:
         part : SteelPart
-            SteelPart object associated with the hole
-        hole_line_test : str
-            row from DSTV file containing info about the hole
+            SteelPart object the holes belong to, only its partmark and profile info is kept
+        holes_lines : list
+            BO block rows split into fields
         """
-        self.part = part
-        self.partmark = self.part.partmark
-
-        self.get_hole_line_list(hole_line_text)
-        self.get_surface()
-        self.get_diameter()
-        self.get_slotted_info()
-        self.get_hole_type()
-        self.get_x_distance()
-        self.get_y_distance()
-    
-    def get_hole_line_list(self, line_text):
-        """Get list of elements containg info about hole geometry"""
-        self.hole_line = line_text.split()
-    
-    def get_surface(self) -> str:
-        """Get surface of part on which the hole is located"""
-        if self.part.profile_type == "t":
-            match self.hole_line[0]:
+        self.partmark = part.partmark
+        self.profile_type = part.profile_type
+        self.profile_depth = part.profile_depth
+
+        self.surface_code = array("b")
+        self.hole_type = array("b")
+        self.diameter = array("q")
+        self.slotted = array("b")
+        self.slot_x = array("q")
+        self.slot_y = array("q")
+        self.x = array("q")
+        self.y = array("q")
+
+        for hole_line in holes_lines:
+            self.append(hole_line)
+        transform_holes(self)
+
+    def append(self, hole_line: list) -> None:
+        """Add hole from list of hole info row"""
+        self.surface_code.append(SURFACE_CODES.index(hole_line[0]))
+
+        type_string = hole_line[2]
+        if "g" in type_string:
+            hole_type = "r_thrd"
+        elif "l" in type_string:
+            hole_type = "l_thrd"
+        elif "m" in type_string:
+            hole_type = "mark"
+        else:
+            hole_type = "std"
+        self.hole_type.append(HOLE_TYPES.index(hole_type))
+
+        if hole_type != "std":
+            type_string = type_string[:-1]
+        self.x.append(to_micrometres(hole_line[1][:-1]))
+        self.y.append(to_micrometres(type_string))
+        self.diameter.append(to_micrometres(hole_line[3]))
+
+        if len(hole_line) == 4:
+            self.slotted.append(False)
+            self.slot_x.append(0)
+            self.slot_y.append(0)
+        else:
+            self.slotted.append(True)
+            self.slot_x.append(to_micrometres(hole_line[5]))
+            self.slot_y.append(to_micrometres(hole_line[6]))
+
+    def __len__(self):
+        return len(self.surface_code)
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("hole index out of range")
+        return Hole(self, index)
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield Hole(self, index)
+
+
+class Hole:
+    """A class to access geometry and location of single hole stored in HoleTable object"""
+    __slots__ = ("table", "index")
+
+    def __init__(self, table, index):
+        """
+        Parameters:
+        table : HoleTable
+            HoleTable object storing the hole
+        index : int
+            row of the hole in the table
+        """
+        self.table = table
+        self.index = index
+
+    @property
+    def partmark(self) -> str:
+        return self.table.partmark
+
+    @property
+    def hole_type(self) -> str:
+        """Type of hole: std, r_thrd, l_thrd or mark"""
+        return HOLE_TYPES[self.table.hole_type[self.index]]
+
+    @property
+    def surface(self) -> str:
+        """Surface of part on which the hole is located"""
+        surface_code = SURFACE_CODES[self.table.surface_code[self.index]]
+        if self.table.profile_type == "t":
+            match surface_code:
                 case "v":
-                    self.surface = "top"
+                    return "top"
                 case "o":
-                    self.surface = "front"
+                    return "front"
         else:
-            match self.hole_line[0]:
+            match surface_code:
                 case "v":
-                    self.surface = "front"
+                    return "front"
                 case "o":
-                    self.surface = "top"
+                    return "top"
                 case "u":
-                    self.surface = "bottom"
-            
-    def get_diameter(self):
-        """Get hole diameter in mm*10 from list of hole info row"""
-        diameter_string = self.hole_line[3]
-        self.diameter = float(diameter_string)*10
-
-    def get_slotted_info(self):
-        """Get information about slotted holes from list of hole info row"""
-        if len(self.hole_line) == 4:
-            self.slotted = False
-            self.slot_x = 0
-            self.slot_y = 0
-            self.size = str(round(self.diameter))
-            self.size_mm = str(round(self.diameter/10, 1))
-            self.size_inch = str(round(self.diameter/254, 3))
-        else:
-            self.slotted = True
-            self.slot_x = float(self.hole_line[5])*10
-            self.slot_y = float(self.hole_line[6])*10
-            self.size = f"{round(self.diameter+self.slot_x)}X{round(self.diameter+self.slot_y)}"
-            self.size_mm = f"{round((self.diameter+self.slot_x)/10, 1)}X{round((self.diameter+self.slot_y)/10, 1)}"
-            self.size_inch = f"{round((self.diameter+self.slot_x)/254, 3)}X{round((self.diameter+self.slot_y)/254, 3)}"
-
-    def get_hole_type(self) -> int:
-        """Get type of hole from list of hole info row"""
-        type_string = self.hole_line[2]
-        if "g" in type_string:
-            self.hole_type = "r_thrd"
-        elif "l" in type_string:
-            self.hole_type = "l_thrd"
-        elif "m" in type_string:
-            self.hole_type = "mark"
-            self.diameter = 0
-            self.size = "0"
-        else:
-            self.hole_type = "std"
-    
-    def get_x_distance(self) -> int:
-        """Get x distance from left end of part to hole center in mm*1000 from list of hole info row"""
-        distance_string = self.hole_line[1][:-1]
-        self.x_distance = float(distance_string)*1000 + 100*self.slot_x/2
-    
-    def get_y_distance(self) -> int:
-        """Get y distance to hole center in mm*1000 from list of hole info row"""
-        distance_string = self.hole_line[2]
-        if self.hole_type != "std":
-            distance_string = distance_string[:-1]
-
-        if self.surface == "front" and self.part.profile_type == "t":
-            self.y_distance = float(distance_string)*1000 - 100*self.slot_y/2
-        elif self.surface == "front":
-            self.y_distance = self.part.profile_depth*100 - float(distance_string)*1000 + 100*self.slot_y/2
+                    return "bottom"
+
+    @property
+    def nominal_diameter(self) -> float:
+        """Hole diameter in mm*10 as given in DSTV file, also for marks"""
+        return self.table.diameter[self.index]/1000*10
+
+    @property
+    def diameter(self) -> float:
+        """Hole diameter in mm*10, marks have diameter 0"""
+        if self.hole_type == "mark":
+            return 0
+        return self.nominal_diameter
+
+    @property
+    def slotted(self) -> bool:
+        return bool(self.table.slotted[self.index])
+
+    @property
+    def slot_x(self) -> float:
+        """Slot length in x direction in mm*10"""
+        return self.table.slot_x[self.index]/1000*10
+
+    @property
+    def slot_y(self) -> float:
+        """Slot length in y direction in mm*10"""
+        return self.table.slot_y[self.index]/1000*10
+
+    @property
+    def size(self) -> str:
+        if self.hole_type == "mark":
+            return "0"
+        if not self.slotted:
+            return str(round(self.diameter))
+        return f"{round(self.diameter+self.slot_x)}X{round(self.diameter+self.slot_y)}"
+
+    @property
+    def size_mm(self) -> str:
+        diameter = self.nominal_diameter
+        if not self.slotted:
+            return str(round(diameter/10, 1))
+        return f"{round((diameter+self.slot_x)/10, 1)}X{round((diameter+self.slot_y)/10, 1)}"
+
+    @property
+    def size_inch(self) -> str:
+        diameter = self.nominal_diameter
+        if not self.slotted:
+            return str(round(diameter/254, 3))
+        return f"{round((diameter+self.slot_x)/254, 3)}X{round((diameter+self.slot_y)/254, 3)}"
+
+    @property
+    def x_distance(self) -> float:
+        """X distance from left end of part to hole center in mm*1000"""
+        return self.table.x_distance[self.index]
+
+    @property
+    def y_distance(self) -> float:
+        """Y distance to hole center in mm*1000"""
+        return self.table.y_distance[self.index]
+
+
+def transform_holes(*tables) -> None:
+    """
+    Compute hole center distances in mm*1000 for all holes of given HoleTable objects.
+    Surface and profile type rules are resolved once per table, holes are then transformed
+    in one pass over the columns and stored in x_distance and y_distance arrays of each table.
+    Call it again after appending holes to a table.
+    """
+    for table in tables:
+        # Rule per surface code: 0 - tee front, 1 - front flipped against profile depth, 2 - other surfaces
+        if table.profile_type == "t":
+            rules = tuple(0 if code == "o" else 2 for code in SURFACE_CODES)
         else:
-            self.y_distance = float(distance_string)*1000 - 100*self.slot_y*50/2
+            rules = tuple(1 if code == "v" else 2 for code in SURFACE_CODES)
+        depth = table.profile_depth*100
+
+        # Operations kept in the same order as the former per-hole float calculation
+        x = [value/1000*1000 for value in table.x]
+        y = [value/1000*1000 for value in table.y]
+        slot_x = [100*(value/1000*10) for value in table.slot_x]
+        slot_y = [100*(value/1000*10) for value in table.slot_y]
+
+        table.x_distance = array("d", [x_value + slot/2 for x_value, slot in zip(x, slot_x)])
+        table.y_distance = array("d", [
+            y_value - slot/2 if rule == 0 else depth - y_value + slot/2 if rule == 1 else y_value - slot*50/2
+            for rule, y_value, slot in zip((rules[code] for code in table.surface_code), y, slot_y)
+        ])
+
+
+class PartRecord:
+    """A class to store decoded SteelPart data without DSTV file content, cheap to pickle between processes"""
+    __slots__ = (
+        "path", "correct_dstv_format", "partmark", "profile", "profile_type", "valid_profile_type", "quantity",
+        "profile_depth", "web_thickness", "flange_height", "flange_thickness", "length", "content_hash", "holes"
+        )
+
+    def __init__(self, part, with_holes=True):
+        """
+        Parameters:
+        part : SteelPart
+            decoded SteelPart object
+        with_holes : bool
+            decode and keep part holes, otherwise holes is None
+        """
+        for name in self.__slots__:
+            if name != "holes":
+                setattr(self, name, getattr(part, name, None))
+        self.holes = part.holes if with_holes and part.correct_dstv_format else None
+
+
+def decode_part(path, profile_types=None, with_hash=False) -> PartRecord:
+    """
+    Decode single DSTV file into PartRecord.
+    Holes of parts with profile type not in profile_types are not read from the file.
+    With with_hash the whole file is read once and content_hash of the record is set from its bytes, see hash_dstv.
+    """
+    content = None
+    content_hash = None
+    if with_hash:
+        with open(path, "rb") as f:
+            data = f.read()
+        content_hash = hash_dstv(path, data)
+        # Decoded the same way as a file opened in text mode
+        content = io.TextIOWrapper(io.BytesIO(data)).read()
+
+    if profile_types is None:
+        record = PartRecord(SteelPart(path, content=content))
+    else:
+        part = SteelPart(path, lazy=True, content=content)
+        record = PartRecord(part, part.correct_dstv_format and part.profile_type in profile_types)
+    if with_hash:
+        record.content_hash = content_hash
+    return record
+
+
+def decode_chunk(paths, profile_types=None, with_hash=False) -> list:
+    """Decode list of DSTV files into list of PartRecord objects"""
+    return [decode_part(path, profile_types, with_hash) for path in paths]
+
+
+def decode_many(paths, workers=None, chunk_size=64, profile_types=None, with_hash=False, total=None):
+    """
+    Decode DSTV files in a process pool and yield PartRecord objects in completion order.
+    Parameters:
+    paths : iterable
+        paths to .NC1 files, an iterator is consumed as chunks are submitted
+    workers : int
+        number of worker processes, defaults to number of CPUs; with 1 files are decoded in current process
+    chunk_size : int
+        maximum number of files decoded by a worker in a single task,
+        jobs not larger than single chunk are decoded in current process
+    profile_types : list
+        profile types of parts whose holes are decoded, holes of other parts are skipped; all if None
+    with_hash : bool
+        set content_hash of records from file bytes read by the worker
+    total : int
+        expected number of paths when paths is an iterator, used to size chunks
+    """
+    if isinstance(paths, (list, tuple)):
+        total = len(paths)
+    paths = iter(paths)
+    if workers is None:
+        workers = os.cpu_count() or 1
+    head = list(islice(paths, chunk_size + 1))
+    if workers <= 1 or len(head) <= chunk_size:
+        for path in chain(head, paths):
+            yield decode_part(path, profile_types, with_hash)
+        return
+
+    # Small chunks keep results streaming back early while limiting per-task overhead
+    if total:
+        chunk_size = max(1, min(chunk_size, total//workers))
+    paths = chain(head, paths)
+    chunks = iter(lambda: list(islice(paths, chunk_size)), [])
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # Limited number of chunks in flight keeps decoded parts from piling up while the consumer stores them
+        pending = set()
+        try:
+            for chunk in chunks:
+                pending.add(executor.submit(decode_chunk, chunk, profile_types, with_hash))
+                if len(pending) >= 2*workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield from future.result()
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield from future.result()
+        finally:
+            for future in pending:
+                future.cancel()
+
 
 def main():
     pass
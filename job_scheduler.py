@@ -0,0 +1,185 @@
+from db_controller import PartDatabase
+from peddimat_encoder import PeddimatEncoder, write_atomic
+import os
+import csv
+import io
+import time
+
+
+SURFACES = ("front", "bottom", "top")
+
+# Number of tool slots of each spindle listed in Peddimat tool row
+TOOL_SLOTS = 9
+
+RUN_LIST_FILE_NAME = "run_list.csv"
+
+
+class ToolMagazine:
+    """
+    A class to track tools loaded in the slots of front, bottom and top spindles.
+    Loaded tools are kept as keys, (surface, slot, size) when parts keep their own tool slots,
+    (surface, size) when tool slots are assigned by the scheduler.
+    """
+    def __init__(self, assign_slots=False):
+        self.assign_slots = assign_slots
+        self.slots = {surface: ["0"]*TOOL_SLOTS for surface in SURFACES}
+        self.last_used = {surface: [-1]*TOOL_SLOTS for surface in SURFACES}
+        self.step = 0
+
+    def required_keys(self, part_tools):
+        """Return set of keys of tools required by part, part_tools is dictionary from surface to list of sizes"""
+        if self.assign_slots:
+            return {(surface, size) for surface in SURFACES for size in part_tools[surface] if size != "0"}
+        return {
+            (surface, slot, size)
+            for surface in SURFACES for slot, size in enumerate(part_tools[surface]) if size != "0"
+            }
+
+    def load(self, part_tools):
+        """
+        Load tools required by part, replacing least recently used tools not required by it.
+        Return (added keys, removed keys, tools) where tools is list of (front, bottom, top) slots for encode_part.
+        """
+        self.step += 1
+        added = set()
+        removed = set()
+        for surface in SURFACES:
+            slots = self.slots[surface]
+            if self.assign_slots:
+                required = [size for size in part_tools[surface] if size != "0"]
+                missing = [size for size in required if size not in slots]
+                free = sorted(
+                    (slot for slot in range(TOOL_SLOTS) if slots[slot] not in required),
+                    key=lambda slot: self.last_used[surface][slot]
+                    )
+                for size, slot in zip(missing, free):
+                    if slots[slot] != "0":
+                        removed.add((surface, slots[slot]))
+                    slots[slot] = size
+                    added.add((surface, size))
+                used_slots = [slot for slot in range(TOOL_SLOTS) if slots[slot] in required]
+            else:
+                used_slots = []
+                for slot, size in enumerate(part_tools[surface]):
+                    if size == "0":
+                        continue
+                    if slots[slot] != size:
+                        if slots[slot] != "0":
+                            removed.add((surface, slot, slots[slot]))
+                        slots[slot] = size
+                        added.add((surface, slot, size))
+                    used_slots.append(slot)
+            for slot in used_slots:
+                self.last_used[surface][slot] = self.step
+
+        tools = None
+        if self.assign_slots:
+            tools = [
+                tuple(self.slots[surface][slot] if self.slots[surface][slot] in part_tools[surface] else "0" for surface in SURFACES)
+                for slot in range(TOOL_SLOTS)
+                ]
+        return added, removed, tools
+
+
+class JobScheduler:
+    """
+    Proposes run order of a job that reduces tool changes between consecutive Peddimat programs.
+    Parts with the same tool table are run together, groups are ordered greedily by fewest tool changes
+    from the tools loaded after the previous group.
+    """
+    def __init__(self, database_connection):
+        self.database_connection = database_connection
+
+    def load_tool_tables(self, partmarks):
+        """Return dictionary from partmark to dictionary from surface to list of tool sizes of its slots"""
+        encoder = PeddimatEncoder(None)
+        tool_tables = {}
+        for part_data in PartDatabase(self.database_connection).iter_parts(partmarks):
+            tools = encoder.get_tools(part_data)[:TOOL_SLOTS]
+            tool_tables[part_data["partmark"]] = {
+                surface: [tool[index] for tool in tools] for index, surface in enumerate(SURFACES)
+                }
+        return tool_tables
+
+    def count_tool_changes(self, tool_tables, partmarks, assign_slots=False):
+        """Return number of tools loaded when parts are run in given order, starting with empty magazine"""
+        magazine = ToolMagazine(assign_slots)
+        return sum(len(magazine.load(tool_tables[partmark])[0]) for partmark in partmarks)
+
+    def schedule(self, tool_tables, assign_slots=False):
+        """
+        Return list of (partmark, tools, tool changes) in proposed run order.
+        tools is tool slots for PeddimatEncoder.encode_part, None if part keeps its own tool slots.
+        """
+        magazine = ToolMagazine(assign_slots)
+        groups = {}
+        for partmark, part_tools in tool_tables.items():
+            key = frozenset(magazine.required_keys(part_tools))
+            groups.setdefault(key, []).append(partmark)
+        groups = list(groups.items())
+
+        # Cost of group is number of its tools not loaded, kept up to date through index from tool key to groups
+        costs = [len(keys) for keys, partmarks in groups]
+        groups_by_key = {}
+        for group_index, (keys, partmarks) in enumerate(groups):
+            for key in keys:
+                groups_by_key.setdefault(key, []).append(group_index)
+
+        run = []
+        remaining = list(range(len(groups)))
+        while remaining:
+            group_index = min(remaining, key=costs.__getitem__)
+            remaining.remove(group_index)
+            for partmark in groups[group_index][1]:
+                added, removed, tools = magazine.load(tool_tables[partmark])
+                run.append((partmark, tools, len(added)))
+                for key in added:
+                    for index in groups_by_key.get(key, ()):
+                        costs[index] -= 1
+                for key in removed:
+                    for index in groups_by_key.get(key, ()):
+                        costs[index] += 1
+        return run
+
+    def save_job(self, partmarks, dir_path="", assign_slots=False, numbered=False):
+        """
+        Write Peddimat files of given parts in proposed run order and run list with position, partmark,
+        file name and tool changes of every program. With numbered file names are prefixed with run position.
+        Return dictionary with number of tool changes in given and in proposed order.
+        """
+        start_time = time.perf_counter()
+        tool_tables = self.load_tool_tables(partmarks)
+        run = self.schedule(tool_tables, assign_slots)
+        run_tools = {partmark: tools for partmark, tools, changes in run}
+
+        file_names = {}
+        for position, (partmark, tools, changes) in enumerate(run, start=1):
+            file_names[partmark] = f"{position:04d}_{partmark}" if numbered else partmark
+
+        # Parts are encoded in database order, only file names and tool slots follow the run order
+        encoder = PeddimatEncoder(None)
+        for part_data in PartDatabase(self.database_connection).iter_parts(partmarks):
+            partmark = part_data["partmark"]
+            peddimat_string = encoder.encode_part(part_data, run_tools[partmark])
+            write_atomic(os.path.join(dir_path, file_names[partmark]), peddimat_string)
+
+        run_list = io.StringIO()
+        writer = csv.writer(run_list, lineterminator="\n")
+        writer.writerow(["position", "partmark", "file", "tool_changes"])
+        for position, (partmark, tools, changes) in enumerate(run, start=1):
+            writer.writerow([position, partmark, file_names[partmark], changes])
+        write_atomic(os.path.join(dir_path, RUN_LIST_FILE_NAME), run_list.getvalue())
+
+        given_order = [partmark for partmark in partmarks if partmark in tool_tables]
+        return {
+            "tool_changes_before": self.count_tool_changes(tool_tables, given_order, assign_slots),
+            "tool_changes_after": sum(changes for partmark, tools, changes in run),
+            "elapsed": time.perf_counter() - start_time,
+            }
+
+
+def main():
+    pass
+
+if __name__ == "__main__":
+    main()
@@ -4,15 +4,199 @@ import subprocess
 
 from PyQt6.QtWidgets import (
     QApplication, QMainWindow, QToolBar, QSlider, QGridLayout, QVBoxLayout, QHBoxLayout, QFileDialog, QWidget,
-    QCheckBox, QComboBox, QListWidget, QTableWidget, QTableWidgetItem, QHeaderView, QGraphicsScene, QGraphicsView,
-    QGraphicsRectItem, QGraphicsEllipseItem, QGraphicsLineItem, QLabel, QSizePolicy, QMessageBox
+    QCheckBox, QComboBox, QListWidget, QTableView, QHeaderView, QGraphicsScene, QGraphicsView,
+    QGraphicsRectItem, QGraphicsLineItem, QLabel, QSizePolicy, QMessageBox, QStyle,
+    QProgressBar, QPushButton, QGraphicsItem
+)
+from PyQt6.QtGui import QAction, QIcon, QPen, QPixmap, QTransform, QPainterPath, QPolygonF
+from PyQt6.QtCore import (
+    Qt, QModelIndex, QThread, QTimer, QPointF, QAbstractTableModel, QSortFilterProxyModel, QStandardPaths, pyqtSignal
 )
-from PyQt6.QtGui import QAction, QIcon, QPen, QPixmap
-from PyQt6.QtCore import Qt, QModelIndex
 
-from db_controller import DatabaseConnection, PartDatabase, HoleDatabase
-from dstv_decoder import SteelPart
+from db_controller import (
+    DatabaseConnection, PartDatabase, ParseCache, MEMORY_SESSION_URI, migrate_schema
+)
 from peddimat_encoder import PeddimatEncoder
+from job_scheduler import JobScheduler
+
+class ImportWorker(QThread):
+    """
+    Decodes, classifies and inserts DSTV files into session database on a background thread.
+    Inserted parts are committed and announced in batches, the first part on its own so it can be viewed early.
+    """
+    prescanned = pyqtSignal(dict)
+    progress = pyqtSignal(int, int)
+    batch_imported = pyqtSignal(list)
+
+    def __init__(self, filepaths, part_database, parse_cache, profile_types, batch_size=50, parent=None):
+        super().__init__(parent)
+        self.filepaths = filepaths
+        self.part_database = part_database
+        self.parse_cache = parse_cache
+        self.profile_types = list(profile_types)
+        self.batch_size = batch_size
+
+    def run(self):
+        try:
+            total = len(self.filepaths)
+            self.progress.emit(0, total)
+
+            # Files are classified from decoded headers as in prescan_many, so the selection is not read in a separate pass
+            prescan = {"valid": [], "wrong_preset": [], "unsupported_profile": []}
+            # Files already imported with the same content are skipped, changed parts are updated in place
+            steel_parts = self.parse_cache.decode_many(
+                self.filepaths, profile_types=self.profile_types, skip_hashes=self.part_database.get_content_hashes()
+                )
+            batch = []
+            imported = 0
+            try:
+                for done, steel_part in enumerate(steel_parts, start=1):
+                    if self.isInterruptionRequested():
+                        break
+                    if not steel_part.correct_dstv_format:
+                        prescan["wrong_preset"].append(steel_part.path)
+                    elif not steel_part.valid_profile_type:
+                        prescan["unsupported_profile"].append(steel_part.path)
+                    else:
+                        prescan["valid"].append(steel_part.path)
+                    if steel_part.correct_dstv_format and steel_part.profile_type in self.profile_types:
+                        batch.append(steel_part)
+                    if batch and (len(batch) >= self.batch_size or not imported):
+                        imported += len(batch)
+                        self.batch_imported.emit(self.part_database.insert_parts(batch))
+                        batch = []
+                    self.progress.emit(done, total)
+                if batch:
+                    self.batch_imported.emit(self.part_database.insert_parts(batch))
+            finally:
+                steel_parts.close()
+            self.prescanned.emit(prescan)
+            self.progress.emit(total, total)
+        finally:
+            self.part_database.database_connection.close_thread_connection()
+            self.parse_cache.database_connection.close_thread_connection()
+
+
+class HolesItem(QGraphicsItem):
+    """
+    Draws all holes of one surface as a single cached path.
+    When holes are smaller than lod_pixels on screen only their centres are drawn.
+    """
+    def __init__(self, hole_rects, pen, lod_pixels=3):
+        """hole_rects is list of (x, y, width, height) ellipse rects in model units"""
+        super().__init__()
+        self.pen = pen
+        self.lod_pixels = lod_pixels
+        self.path = QPainterPath()
+        centres = []
+        max_size = 0
+        for x, y, width, height in hole_rects:
+            self.path.addEllipse(x, y, width, height)
+            centres.append(QPointF(x + width/2, y + height/2))
+            max_size = max(max_size, width, height)
+        self.centres = QPolygonF(centres)
+        self.max_size = max_size
+        # Cosmetic pen is drawn outside of path, margin covers it down to the smallest zoom
+        self.bounding_rect = self.path.boundingRect().adjusted(-100, -100, 100, 100)
+
+    def boundingRect(self):
+        return self.bounding_rect
+
+    def paint(self, painter, option, widget=None):
+        painter.setPen(self.pen)
+        lod = option.levelOfDetailFromTransform(painter.worldTransform())
+        if self.max_size*lod < self.lod_pixels:
+            painter.drawPoints(self.centres)
+        else:
+            painter.drawPath(self.path)
+
+
+class UnitTableModel(QAbstractTableModel):
+    """
+    Read-only table of rows of part or hole data dictionaries, cells are formatted in current unit on demand.
+    columns is list of (label, function of row and unit returning raw value, function of value and unit returning text).
+    UserRole returns raw value used for sorting, or key of sort_keys when column label has one.
+    """
+    columns = []
+    sort_keys = {}
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.rows = []
+        self.unit = "mm"
+
+    def set_rows(self, rows):
+        self.beginResetModel()
+        self.rows = rows
+        self.endResetModel()
+
+    def set_unit(self, unit):
+        self.unit = unit
+        if self.rows:
+            self.dataChanged.emit(self.index(0, 0), self.index(len(self.rows)-1, len(self.columns)-1))
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.columns)
+
+    def data(self, index, role=Qt.ItemDataRole.DisplayRole):
+        if not index.isValid():
+            return None
+        label, value, text = self.columns[index.column()]
+        if role == Qt.ItemDataRole.DisplayRole:
+            return text(value(self.rows[index.row()], self.unit), self.unit)
+        if role == Qt.ItemDataRole.UserRole:
+            if label in self.sort_keys:
+                return self.sort_keys[label](self.rows[index.row()])
+            return value(self.rows[index.row()], self.unit)
+        return None
+
+    def headerData(self, section, orientation, role=Qt.ItemDataRole.DisplayRole):
+        if role == Qt.ItemDataRole.DisplayRole and orientation == Qt.Orientation.Horizontal:
+            return self.columns[section][0]
+        return None
+
+
+def format_length(value, unit):
+    return str(round(value, 1 if unit == "mm" else 3))
+
+
+def format_text(value, unit):
+    return value
+
+
+def format_sequencing(report):
+    """Return lines comparing carriage travel, in x_distance units of mm*1000, and tool changes before and after sequencing"""
+    return [
+        f"Carriage travel: {report.travel_before/1e6:.1f} m before, {report.travel_after/1e6:.1f} m after sequencing.",
+        f"Tool changes: {report.tool_changes_before} before, {report.tool_changes_after} after sequencing.",
+        ]
+
+
+class PartTableModel(UnitTableModel):
+    """Profile and dimensions of current part, dimensions are stored in mm*10"""
+    columns = [
+        ("Profile", lambda part, unit: part["profile"], format_text),
+        ("Length", lambda part, unit: part["length"]/(10 if unit == "mm" else 254), format_length),
+        ("Height", lambda part, unit: part["profile_depth"]/(10 if unit == "mm" else 254), format_length),
+        ("Width", lambda part, unit: part["flange_height"]/(10 if unit == "mm" else 254), format_length),
+        ]
+
+
+class HoleTableModel(UnitTableModel):
+    """Holes of current part, distances are stored in mm*1000"""
+    columns = [
+        ("Surface", lambda hole, unit: hole["surface"], format_text),
+        ("Size", lambda hole, unit: hole["size_mm"] if unit == "mm" else hole["size_inch"], format_text),
+        ("X distance", lambda hole, unit: hole["x_distance"]/(1000 if unit == "mm" else 25400), format_length),
+        ("Y distance", lambda hole, unit: hole["y_distance"]/(1000 if unit == "mm" else 25400), format_length),
+        ]
+    # Size text is not ordered numerically, holes are sorted by the shown size along X.
+    # Marks are stored with diameter 0 but keep their nominal size_mm, so the key is read from size_mm
+    sort_keys = {"Size": lambda hole: float(hole["size_mm"].split("X")[0])}
+
 
 class MainWindow(QMainWindow):
     def __init__(self):
@@ -20,7 +204,15 @@ class MainWindow(QMainWindow):
         self.setWindowTitle("DSTV-Peddimat Converter")
 
         self.basedir = os.path.dirname(__file__)
-        self.database_connection = DatabaseConnection(os.path.join(self.basedir, "current_session.db"))
+        # Reads of GUI thread do not wait for table locks of import worker transaction in shared cache
+        self.database_connection = DatabaseConnection(MEMORY_SESSION_URI, pragmas={"read_uncommitted": 1})
+        migrate_schema(self.database_connection)
+        self.part_database = PartDatabase(self.database_connection)
+        # Parse cache is kept in per-user cache directory, not next to the program
+        cache_dir = QStandardPaths.writableLocation(QStandardPaths.StandardLocation.CacheLocation)
+        os.makedirs(cache_dir, exist_ok=True)
+        self.parse_cache = ParseCache(DatabaseConnection(os.path.join(cache_dir, "parse_cache.db")))
+        self.parse_cache.create_table()
 
         self.setWindowIcon(QIcon(os.path.join(self.basedir, "Icons", "converter.png")))
 
@@ -39,11 +231,39 @@ class MainWindow(QMainWindow):
         export_peddimat_action.triggered.connect(self.export_peddimat)
         toolbar.addAction(export_peddimat_action)
 
+        open_session_icon = self.style().standardIcon(QStyle.StandardPixmap.SP_DialogOpenButton)
+        open_session_action = QAction(open_session_icon, "&open session", self)
+        open_session_action.triggered.connect(self.open_session)
+        toolbar.addAction(open_session_action)
+
+        save_session_icon = self.style().standardIcon(QStyle.StandardPixmap.SP_DialogSaveButton)
+        save_session_action = QAction(save_session_icon, "&save session", self)
+        save_session_action.triggered.connect(self.save_session)
+        toolbar.addAction(save_session_action)
+
+        export_archive_icon = self.style().standardIcon(QStyle.StandardPixmap.SP_FileIcon)
+        export_archive_action = QAction(export_archive_icon, "&export peddimat archive", self)
+        export_archive_action.triggered.connect(self.export_peddimat_archive)
+        toolbar.addAction(export_archive_action)
+
+        export_job_icon = self.style().standardIcon(QStyle.StandardPixmap.SP_FileDialogListView)
+        export_job_action = QAction(export_job_icon, "&export peddimat job in run order", self)
+        export_job_action.triggered.connect(self.export_peddimat_job)
+        toolbar.addAction(export_job_action)
+
         remove_list_item_icon = QIcon(os.path.join(self.basedir, "Icons", "bin.png"))
         remove_list_item_action = QAction(remove_list_item_icon, "&remove selected", self)
         remove_list_item_action.triggered.connect(self.remove_list_item)
         toolbar.addAction(remove_list_item_action)
 
+        # Session database is written only by import worker while it runs, and GUI reads see its uncommitted rows,
+        # so parts are not exported or saved until the import is finished
+        self.import_blocked_actions = [
+            import_dstv_action, open_session_action, remove_list_item_action, save_session_action,
+            export_peddimat_action, export_archive_action, export_job_action
+            ]
+        self.import_worker = None
+
         toolbar.addSeparator()
 
         self.valid_profile_types = ["B", "C", "T", "t"]
@@ -71,6 +291,10 @@ class MainWindow(QMainWindow):
 
         toolbar.addSeparator()
 
+        self.sequence_holes_checkbox = QCheckBox("sequence holes", self)
+        self.sequence_holes_checkbox.setChecked(False)
+        toolbar.addWidget(self.sequence_holes_checkbox)
+
         # self.ignore_parts_without_holes = False
         # self.ignore_parts_without_holes_checkbox = QCheckBox("ignore parts without holes", self)
         # self.ignore_parts_without_holes_checkbox.setChecked(False)
@@ -83,6 +307,7 @@ class MainWindow(QMainWindow):
         toolbar.addWidget(spacer)
 
         self.scale = 0.05
+        self.part_data = None
 
         scale_slider = QSlider(Qt.Orientation.Horizontal)
         scale_slider.setValue(50)
@@ -109,6 +334,8 @@ class MainWindow(QMainWindow):
         self.part_list_widget.setFixedWidth(150)
         self.part_list_widget.setAlternatingRowColors(True)
         self.part_list_widget.currentItemChanged.connect(self.part_list_index_changed)
+        # Partmarks shown in part list, kept so import batches are added without reading the whole list
+        self.listed_partmarks = set()
 
         table_unit_label = QLabel("Table units:")
         table_unit_label.setFixedWidth(75)
@@ -116,16 +343,25 @@ class MainWindow(QMainWindow):
         self.table_unit_combobox.setFixedWidth(75)
         self.table_unit_combobox.addItems(["mm", "inch"])
         self.table_unit_combobox.currentIndexChanged.connect(self.table_unit_combobox_index_changed)
+        hole_surface_label = QLabel("Surface:")
+        hole_surface_label.setFixedWidth(55)
+        self.hole_surface_combobox = QComboBox()
+        self.hole_surface_combobox.setFixedWidth(75)
+        self.hole_surface_combobox.addItems(["all", "front", "top", "bottom"])
+        self.hole_surface_combobox.currentIndexChanged.connect(self.hole_surface_combobox_index_changed)
         self.create_part_info_table()
         self.create_hole_info_table()
 
+        # Cosmetic pens keep 1 px width under zoom transform of views
         self.solid_pen = QPen(Qt.GlobalColor.white)
         self.solid_pen.setStyle(Qt.PenStyle.SolidLine)
         self.solid_pen.setWidth(1)
+        self.solid_pen.setCosmetic(True)
 
         self.dashed_pen = QPen(Qt.GlobalColor.white)
         self.dashed_pen.setStyle(Qt.PenStyle.DashLine)
         self.dashed_pen.setWidth(1)
+        self.dashed_pen.setCosmetic(True)
 
         self.create_part_views()
 
@@ -133,6 +369,8 @@ class MainWindow(QMainWindow):
         unit_layout.setAlignment(Qt.AlignmentFlag.AlignLeft)
         unit_layout.addWidget(table_unit_label)
         unit_layout.addWidget(self.table_unit_combobox)
+        unit_layout.addWidget(hole_surface_label)
+        unit_layout.addWidget(self.hole_surface_combobox)
 
         table_layout = QVBoxLayout()
         table_layout.addLayout(unit_layout)
@@ -150,6 +388,14 @@ class MainWindow(QMainWindow):
         widget.setLayout(layout)
         self.setCentralWidget(widget)
 
+        self.import_progress_bar = QProgressBar()
+        self.import_progress_bar.setFixedWidth(200)
+        self.cancel_import_button = QPushButton("cancel import")
+        self.statusBar().addPermanentWidget(self.import_progress_bar)
+        self.statusBar().addPermanentWidget(self.cancel_import_button)
+        self.import_progress_bar.hide()
+        self.cancel_import_button.hide()
+
         # self.showMaximized()
         self.show()
     
@@ -162,104 +408,102 @@ class MainWindow(QMainWindow):
     
     def scale_slider_changed(self, value):
         self.scale = value/1000
-        if self.part_list_widget.currentItem():
-            partmark = self.part_list_widget.currentItem().text()
-            self.draw_part(partmark)
+        # Slider ticks are collected and applied once they stop
+        self.zoom_timer.start()
+
+    def apply_zoom(self):
+        transform = QTransform.fromScale(self.scale, self.scale)
+        for view in self.views:
+            view.setTransform(transform)
     
     def populate_part_list_widget(self):
         self.part_list_widget.clear()
         partmarks = self.part_database.get_partmarks_list()
         self.part_list_widget.addItems(partmarks)
+        self.listed_partmarks = set(partmarks)
+    
+    def update_part_list_widget(self, updated_partmarks):
+        # Parts are only added while importing, new parts of the batch are appended in database order
+        new_partmarks = []
+        for partmark in updated_partmarks:
+            if partmark not in self.listed_partmarks:
+                self.listed_partmarks.add(partmark)
+                new_partmarks.append(partmark)
+        self.part_list_widget.addItems(new_partmarks)
+
+        current_item = self.part_list_widget.currentItem()
+        if not current_item and self.part_list_widget.count():
+            self.part_list_widget.setCurrentItem(self.part_list_widget.item(0))
+        elif current_item and current_item.text() in updated_partmarks:
+            self.part_list_index_changed(current_item)
     
     def part_list_index_changed(self, index):
         if index:
             partmark = index.text()
-            self.populate_part_info_table(partmark)
-            self.populate_hole_info_table(partmark)
-            self.draw_part(partmark)
+            # Part row and holes are loaded once and shared by tables and views
+            self.part_data = self.part_database.load_parts([partmark])[0]
+            self.populate_part_info_table(self.part_data)
+            self.populate_hole_info_table(self.part_data)
+            self.draw_part(self.part_data)
     
     def remove_list_item(self):
         current_item = self.part_list_widget.currentItem()
         if current_item:
             partmark = current_item.text()
-            self.hole_database.remove_data(partmark)
             self.part_database.remove_data(partmark)
             self.part_list_widget.takeItem(self.part_list_widget.row(current_item))
+            self.listed_partmarks.discard(partmark)
 
         current_item = self.part_list_widget.currentItem()
         if not current_item:
             self.clear_scenes()
-            self.hole_info_table.setRowCount(0)
-            self.part_info_table.setRowCount(0)
+            self.hole_table_model.set_rows([])
+            self.part_table_model.set_rows([])
     
     def table_unit_combobox_index_changed(self):
-        current_item = self.part_list_widget.currentItem()
-        if current_item:
-            partmark = current_item.text()
-            self.populate_part_info_table(partmark)
-            self.populate_hole_info_table(partmark)
+        # Cells are formatted on demand, models only announce changed data
+        unit = self.table_unit_combobox.currentText()
+        self.part_table_model.set_unit(unit)
+        self.hole_table_model.set_unit(unit)
+
+    def hole_surface_combobox_index_changed(self):
+        surface = self.hole_surface_combobox.currentText()
+        self.hole_proxy_model.setFilterFixedString("" if surface == "all" else surface)
     
     def create_part_info_table(self):
-        self.part_info_table = QTableWidget(0, 4)
-        self.part_info_table.setSelectionMode(QTableWidget.SelectionMode.NoSelection)
-        self.part_info_table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        self.part_table_model = PartTableModel(self)
+        self.part_info_table = QTableView()
+        self.part_info_table.setModel(self.part_table_model)
+        self.part_info_table.setSelectionMode(QTableView.SelectionMode.NoSelection)
+        self.part_info_table.setEditTriggers(QTableView.EditTrigger.NoEditTriggers)
         self.part_info_table.setFixedWidth(350)
         self.part_info_table.setFixedHeight(50)
-        labels = ["Profile", "Length", "Height", "Width"]
-        self.part_info_table.setHorizontalHeaderLabels(labels)
-        for i, label in enumerate(labels):
-            self.part_info_table.horizontalHeader().setSectionResizeMode(i, QHeaderView.ResizeMode.Stretch)
+        self.part_info_table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
         self.part_info_table.verticalHeader().setVisible(False)
     
-    def populate_part_info_table(self, partmark):
-        self.part_info_table.setRowCount(0)
-
-        part_geometry = self.part_database.get_part_geometry(partmark)
-        if part_geometry:
-            if self.table_unit_combobox.currentText() == "mm":
-                self.part_info_table.insertRow(0)
-                self.part_info_table.setItem(0, 0, QTableWidgetItem(part_geometry["profile"]))
-                self.part_info_table.setItem(0, 1, QTableWidgetItem(str(round(part_geometry["length"]/10, 1))))
-                self.part_info_table.setItem(0, 2, QTableWidgetItem(str(round(part_geometry["profile_depth"]/10, 1))))
-                self.part_info_table.setItem(0, 3, QTableWidgetItem(str(round(part_geometry["flange_height"]/10, 1))))
-            elif self.table_unit_combobox.currentText() == "inch":
-                self.part_info_table.insertRow(0)
-                self.part_info_table.setItem(0, 0, QTableWidgetItem(part_geometry["profile"]))
-                self.part_info_table.setItem(0, 1, QTableWidgetItem(str(round(part_geometry["length"]/254, 3))))
-                self.part_info_table.setItem(0, 2, QTableWidgetItem(str(round(part_geometry["profile_depth"]/254, 3))))
-                self.part_info_table.setItem(0, 3, QTableWidgetItem(str(round(part_geometry["flange_height"]/254, 3))))
+    def populate_part_info_table(self, part_geometry):
+        self.part_table_model.set_rows([part_geometry] if part_geometry else [])
 
     def create_hole_info_table(self):
-        self.hole_info_table = QTableWidget(0, 4)
-        self.hole_info_table.setSelectionMode(QTableWidget.SelectionMode.NoSelection)
-        self.hole_info_table.setEditTriggers(QTableWidget.EditTrigger.NoEditTriggers)
+        self.hole_table_model = HoleTableModel(self)
+        self.hole_proxy_model = QSortFilterProxyModel(self)
+        self.hole_proxy_model.setSourceModel(self.hole_table_model)
+        self.hole_proxy_model.setSortRole(Qt.ItemDataRole.UserRole)
+        self.hole_proxy_model.setFilterKeyColumn(0)
+
+        self.hole_info_table = QTableView()
+        self.hole_info_table.setModel(self.hole_proxy_model)
+        self.hole_info_table.setSelectionMode(QTableView.SelectionMode.NoSelection)
+        self.hole_info_table.setEditTriggers(QTableView.EditTrigger.NoEditTriggers)
         self.hole_info_table.setFixedWidth(350)
-        labels = ["Surface", "Size", "X distance", "Y distance"]
-        self.hole_info_table.setHorizontalHeaderLabels(labels)
-        for i, label in enumerate(labels):
-            self.hole_info_table.horizontalHeader().setSectionResizeMode(i, QHeaderView.ResizeMode.Stretch)
+        self.hole_info_table.horizontalHeader().setSectionResizeMode(QHeaderView.ResizeMode.Stretch)
         self.hole_info_table.verticalHeader().setVisible(False)
+        # Holes are listed in program order until a column header is clicked
+        self.hole_info_table.setSortingEnabled(True)
+        self.hole_info_table.sortByColumn(-1, Qt.SortOrder.AscendingOrder)
 
-    def populate_hole_info_table(self, partmark):
-        self.hole_info_table.setRowCount(0)
-
-        hole_info_list = self.hole_database.get_hole_info_list(partmark)
-        if hole_info_list:
-            for hole in hole_info_list:
-                if self.table_unit_combobox.currentText() == "mm":
-                    row_position = self.hole_info_table.rowCount()
-                    self.hole_info_table.insertRow(self.hole_info_table.rowCount())
-                    self.hole_info_table.setItem(row_position, 0, QTableWidgetItem(hole["surface"]))
-                    self.hole_info_table.setItem(row_position, 1, QTableWidgetItem(hole["size_mm"]))
-                    self.hole_info_table.setItem(row_position, 2, QTableWidgetItem(str(round(hole["x_distance"]/1000, 1))))
-                    self.hole_info_table.setItem(row_position, 3, QTableWidgetItem(str(round(hole["y_distance"]/1000, 1))))
-                elif self.table_unit_combobox.currentText() == "inch":
-                    row_position = self.hole_info_table.rowCount()
-                    self.hole_info_table.insertRow(self.hole_info_table.rowCount())
-                    self.hole_info_table.setItem(row_position, 0, QTableWidgetItem(hole["surface"]))
-                    self.hole_info_table.setItem(row_position, 1, QTableWidgetItem(hole["size_inch"]))
-                    self.hole_info_table.setItem(row_position, 2, QTableWidgetItem(str(round(hole["x_distance"]/25400, 3))))
-                    self.hole_info_table.setItem(row_position, 3, QTableWidgetItem(str(round(hole["y_distance"]/25400, 3))))
+    def populate_hole_info_table(self, part_data):
+        self.hole_table_model.set_rows(part_data["holes"])
     
     def create_part_views(self):
         self.top_scene = QGraphicsScene(0, 0, 1100, 300)
@@ -275,6 +519,13 @@ class MainWindow(QMainWindow):
 
         for view in self.views:
             view.setMinimumSize(800, 200)
+            view.setAlignment(Qt.AlignmentFlag.AlignLeft | Qt.AlignmentFlag.AlignVCenter)
+
+        self.zoom_timer = QTimer(self)
+        self.zoom_timer.setSingleShot(True)
+        self.zoom_timer.setInterval(30)
+        self.zoom_timer.timeout.connect(self.apply_zoom)
+        self.apply_zoom()
 
         for scene in self.scenes:
             scene.setBackgroundBrush(Qt.GlobalColor.black)
@@ -284,41 +535,31 @@ class MainWindow(QMainWindow):
         self.front_scene.clear()
         self.bottom_scene.clear()
     
-    def draw_part(self, partmark):
+    def draw_part(self, part_geometry):
+        """Build scenes of part once in model units (mm*10), zoom is applied by view transform"""
         self.clear_scenes()
-        part_geometry = self.part_database.get_part_geometry(partmark)
 
-        scene_width = 100 + part_geometry["length"]*self.scale
-        for scene in self.scenes:
-            scene.setSceneRect(0, 0, scene_width, scene.height())
-
-        self.draw_part_top(partmark, part_geometry)
-        self.draw_part_front(partmark, part_geometry)
-        self.draw_part_bottom(partmark, part_geometry)
-
-        # Offset graphic items from view border
-        top_y_offset = self.top_scene.height()/2 - part_geometry["flange_height"]/2 * self.scale
-        front_y_offset = self.front_scene.height()/2 - part_geometry["profile_depth"]/2 * self.scale
-        bottom_y_offset = self.bottom_scene.height()/2 - part_geometry["flange_height"]/2 * self.scale
-
-        for item in self.top_scene.items():
-            item.moveBy(50, top_y_offset)
-        for item in self.front_scene.items():
-            item.moveBy(50, front_y_offset)
-        for item in self.bottom_scene.items():
-            item.moveBy(50, bottom_y_offset)
+        self.draw_part_top(part_geometry)
+        self.draw_part_front(part_geometry)
+        self.draw_part_bottom(part_geometry)
+
+        # Margin of 50 mm around the part, views center the part vertically
+        length = part_geometry["length"]
+        self.top_scene.setSceneRect(-500, -500, length + 1000, part_geometry["flange_height"] + 1000)
+        self.front_scene.setSceneRect(-500, -500, length + 1000, part_geometry["profile_depth"] + 1000)
+        self.bottom_scene.setSceneRect(-500, -500, length + 1000, part_geometry["flange_height"] + 1000)
     
-    def draw_part_top(self, partmark, part_geometry):
-        height = part_geometry["flange_height"]*self.scale
-        length = part_geometry["length"]*self.scale
+    def draw_part_top(self, part_geometry):
+        height = part_geometry["flange_height"]
+        length = part_geometry["length"]
 
-        self.draw_holes_top(partmark)
+        self.draw_holes_top(part_geometry)
 
         outline = QGraphicsRectItem(0, 0, length, height)
         outline.setPen(self.solid_pen)
         self.top_scene.addItem(outline)
 
-        web_thickness = part_geometry["web_thickness"]*self.scale
+        web_thickness = part_geometry["web_thickness"]
 
         if part_geometry["profile_type"] == "B":
             top_web_y = height/2 - web_thickness/2
@@ -356,17 +597,17 @@ class MainWindow(QMainWindow):
             self.top_scene.addItem(top_web)
             self.top_scene.addItem(bottom_web)
 
-    def draw_part_front(self, partmark, part_geometry):
-        depth = part_geometry["profile_depth"]*self.scale
-        length = part_geometry["length"]*self.scale
+    def draw_part_front(self, part_geometry):
+        depth = part_geometry["profile_depth"]
+        length = part_geometry["length"]
 
-        self.draw_holes_front(partmark)
+        self.draw_holes_front(part_geometry)
 
         outline = QGraphicsRectItem(0, 0, length, depth)
         outline.setPen(self.solid_pen)
         self.front_scene.addItem(outline)
 
-        flange_thickness = part_geometry["flange_thickness"]*self.scale
+        flange_thickness = part_geometry["flange_thickness"]
         top_flange_y = flange_thickness
         bottom_flange_y = depth - flange_thickness
         top_flange = QGraphicsLineItem(0, top_flange_y, length, top_flange_y)
@@ -394,18 +635,18 @@ class MainWindow(QMainWindow):
 
             
         
-    def draw_part_bottom(self, partmark, part_geometry):
-        height = part_geometry["flange_height"]*self.scale
-        length = part_geometry["length"]*self.scale
+    def draw_part_bottom(self, part_geometry):
+        height = part_geometry["flange_height"]
+        length = part_geometry["length"]
 
-        self.draw_holes_bottom(partmark, height)
+        self.draw_holes_bottom(part_geometry, height)
 
         outline = QGraphicsRectItem(0, 0, length, height)
 
         outline.setPen(self.solid_pen)
         self.bottom_scene.addItem(outline)
 
-        web_thickness = part_geometry["web_thickness"]*self.scale
+        web_thickness = part_geometry["web_thickness"]
 
         if part_geometry["profile_type"] == "B":
             top_web_y = height/2 - web_thickness/2
@@ -436,85 +677,106 @@ class MainWindow(QMainWindow):
         elif part_geometry["profile_type"] == "t":
             self.bottom_scene.clear()
 
-    def draw_holes_top(self, partmark):
-        hole_geometry_list = self.hole_database.get_hole_geometry_list(partmark, "top")
-        if hole_geometry_list:
-            for hole_geometry in hole_geometry_list:
-                x_diameter = (hole_geometry[0]+hole_geometry[1])*self.scale
-                y_diameter = (hole_geometry[0]+hole_geometry[2])*self.scale
-          
+    def draw_holes_top(self, part_data):
+        hole_rects = []
+        for hole_geometry in part_data["holes"]:
+            if hole_geometry["surface"] == "top":
+                x_diameter = hole_geometry["diameter"] + hole_geometry["slot_x"]
+                y_diameter = hole_geometry["diameter"] + hole_geometry["slot_y"]
+
                 # Distance measured to top left corner of ellipse rect
-                x_distance = hole_geometry[3]*self.scale/100 - x_diameter/2
-                y_distance = hole_geometry[4]*self.scale/100 - y_diameter/2
+                x_distance = hole_geometry["x_distance"]/100 - x_diameter/2
+                y_distance = hole_geometry["y_distance"]/100 - y_diameter/2
+                hole_rects.append((x_distance, y_distance, x_diameter, y_diameter))
 
-                hole = QGraphicsEllipseItem(x_distance, y_distance, x_diameter, y_diameter)
-                hole.setPen(self.solid_pen)
-                self.top_scene.addItem(hole)
+        if hole_rects:
+            self.top_scene.addItem(HolesItem(hole_rects, self.solid_pen))
 
-    def draw_holes_front(self, partmark):
-        hole_geometry_list = self.hole_database.get_hole_geometry_list(partmark, "front")
-        if hole_geometry_list:
-            for hole_geometry in hole_geometry_list:
-                x_diameter = (hole_geometry[0]+hole_geometry[1])*self.scale
-                y_diameter = (hole_geometry[0]+hole_geometry[2])*self.scale
+    def draw_holes_front(self, part_data):
+        hole_rects = []
+        for hole_geometry in part_data["holes"]:
+            if hole_geometry["surface"] == "front":
+                x_diameter = hole_geometry["diameter"] + hole_geometry["slot_x"]
+                y_diameter = hole_geometry["diameter"] + hole_geometry["slot_y"]
 
                 # Distance measured to top left corner of ellipse rect
-                x_distance = hole_geometry[3]*self.scale/100 - x_diameter/2
-                y_distance = hole_geometry[4]*self.scale/100 - y_diameter/2
-
-                hole = QGraphicsEllipseItem(x_distance, y_distance, x_diameter, y_diameter)
-                hole.setPen(self.solid_pen)
-                self.front_scene.addItem(hole)
-
-    def draw_holes_bottom(self, partmark, flange_height):
-        hole_geometry_list = self.hole_database.get_hole_geometry_list(partmark, "bottom")
-        if hole_geometry_list:
-            for hole_geometry in hole_geometry_list:
-                x_diameter = (hole_geometry[0]+hole_geometry[1])*self.scale
-                y_diameter = (hole_geometry[0]+hole_geometry[2])*self.scale
-          
+                x_distance = hole_geometry["x_distance"]/100 - x_diameter/2
+                y_distance = hole_geometry["y_distance"]/100 - y_diameter/2
+                hole_rects.append((x_distance, y_distance, x_diameter, y_diameter))
+
+        if hole_rects:
+            self.front_scene.addItem(HolesItem(hole_rects, self.solid_pen))
+
+    def draw_holes_bottom(self, part_data, flange_height):
+        hole_rects = []
+        for hole_geometry in part_data["holes"]:
+            if hole_geometry["surface"] == "bottom":
+                x_diameter = hole_geometry["diameter"] + hole_geometry["slot_x"]
+                y_diameter = hole_geometry["diameter"] + hole_geometry["slot_y"]
+
                 # Distance measured to top left corner of ellipse rect
-                x_distance = hole_geometry[3]*self.scale/100 - x_diameter/2
-                y_distance = flange_height - hole_geometry[4]*self.scale/100 - y_diameter/2
+                x_distance = hole_geometry["x_distance"]/100 - x_diameter/2
+                y_distance = flange_height - hole_geometry["y_distance"]/100 - y_diameter/2
+                hole_rects.append((x_distance, y_distance, x_diameter, y_diameter))
 
-                hole = QGraphicsEllipseItem(x_distance, y_distance, x_diameter, y_diameter)
-                hole.setPen(self.solid_pen)
-                self.bottom_scene.addItem(hole)
+        if hole_rects:
+            self.bottom_scene.addItem(HolesItem(hole_rects, self.solid_pen))
     
-    def save_to_database(self, filepaths):
-        self.database_connection.delete_old()
-        self.part_database = PartDatabase(self.database_connection)
-        self.part_database.create_table()
-        self.hole_database = HoleDatabase(self.database_connection)
-        self.hole_database.create_table()
-
-        for filepath in filepaths:
-            steel_part = SteelPart(filepath)
-            if steel_part.correct_dstv_format:
-                if steel_part.profile_type in self.valid_profile_types:
-                    self.part_database.insert_data(steel_part)
-                    for hole in steel_part.holes:
-                        self.hole_database.insert_data(hole)
-            else:
-                dialog = QMessageBox(self)
-                dialog.setText(f'{filepath} has incorrect DSTV settings. Use CSS_DSTV export preset.')
-                dialog.setWindowTitle("Incorrect DSTV")
-                dialog.setIcon(QMessageBox.Icon.Warning)
-                dialog.exec()
-                
+    def show_prescan_summary(self, prescan):
+        messages = []
+        if prescan["wrong_preset"]:
+            filenames = "\n".join(os.path.basename(path) for path in prescan["wrong_preset"][:20])
+            messages.append(f'{len(prescan["wrong_preset"])} file(s) have incorrect DSTV settings. Use CSS_DSTV export preset.\n{filenames}')
+        if prescan["unsupported_profile"]:
+            filenames = "\n".join(os.path.basename(path) for path in prescan["unsupported_profile"][:20])
+            messages.append(f'{len(prescan["unsupported_profile"])} file(s) have unsupported profile type.\n{filenames}')
+        if messages:
+            dialog = QMessageBox(self)
+            dialog.setText("\n\n".join(messages))
+            dialog.setWindowTitle("Incorrect DSTV")
+            dialog.setIcon(QMessageBox.Icon.Warning)
+            dialog.exec()
 
     def import_dstv(self):
         dialog = QFileDialog(self)
         openfile_dir = self.get_openfile_directory()
         dialog.setDirectory(openfile_dir)
         filepaths = dialog.getOpenFileNames(self, caption="select .nc1 files", filter="DSTV files (*.nc1)")[0]
-        if filepaths:
-            self.save_to_database(filepaths)
+        if filepaths and not self.import_worker:
             self.save_openfile_directory(filepaths[0])
-            self.populate_part_list_widget()
-            if self.part_list_widget.count():
-                self.part_list_widget.setCurrentItem(self.part_list_widget.item(0))
-        
+            self.prescan = None
+            self.import_worker = ImportWorker(filepaths, self.part_database, self.parse_cache, self.valid_profile_types, parent=self)
+            self.import_worker.prescanned.connect(self.import_prescanned)
+            self.import_worker.progress.connect(self.import_progress)
+            self.import_worker.batch_imported.connect(self.update_part_list_widget)
+            self.import_worker.finished.connect(self.import_finished)
+            self.cancel_import_button.clicked.connect(self.import_worker.requestInterruption)
+
+            for action in self.import_blocked_actions:
+                action.setEnabled(False)
+            self.import_progress_bar.setValue(0)
+            self.import_progress_bar.show()
+            self.cancel_import_button.show()
+            self.import_worker.start()
+
+    def import_prescanned(self, prescan):
+        self.prescan = prescan
+
+    def import_progress(self, done, total):
+        self.import_progress_bar.setMaximum(max(total, 1))
+        self.import_progress_bar.setValue(done)
+
+    def import_finished(self):
+        self.cancel_import_button.clicked.disconnect(self.import_worker.requestInterruption)
+        self.import_worker.deleteLater()
+        self.import_worker = None
+        for action in self.import_blocked_actions:
+            action.setEnabled(True)
+        self.import_progress_bar.hide()
+        self.cancel_import_button.hide()
+        if self.prescan:
+            self.show_prescan_summary(self.prescan)
+
     def get_openfile_directory(self):
         if os.path.exists(os.path.join(self.basedir, "lastdir.txt")):
             with open(os.path.join(self.basedir, "lastdir.txt"), "r") as f:
@@ -535,17 +797,111 @@ class MainWindow(QMainWindow):
             output_directory = QFileDialog.getExistingDirectory(self, caption="select output directory")
             if output_directory:
                 peddimat_encoder = PeddimatEncoder(self.database_connection)
-                for partmark in partmarks:
-                    peddimat_encoder.save_peddimat_file(partmark, output_directory)    
-                os.startfile(output_directory)
+                # Files of unchanged parts are not rewritten, so the machine controller only syncs changed programs
+                sequence = self.sequence_holes_checkbox.isChecked()
+                report = peddimat_encoder.sync_peddimat_files(partmarks, output_directory, sequence=sequence)
+                lines = [
+                    f"{len(report.added)} program(s) added, {len(report.changed)} changed, "
+                    f"{len(report.unchanged)} unchanged."
+                    ]
+                # Only written programs are sequenced, unchanged ones keep their files
+                if sequence and report.written:
+                    lines.extend(format_sequencing(report))
+                if report.orphaned:
+                    # Programs of parts no longer exported are left in the directory for the operator to remove
+                    lines.append(f"{len(report.orphaned)} program(s) of parts not in the list: {', '.join(report.orphaned[:20])}")
+                if report.failed:
+                    lines.append(f"{len(report.failed)} of {len(partmarks)} part(s) could not be exported.")
+                    lines.extend(f"{partmark}: {error}" for partmark, error in list(report.failed.items())[:20])
+                dialog = QMessageBox(self)
+                dialog.setText("\n".join(lines))
+                if report.failed:
+                    dialog.setWindowTitle("Export errors")
+                    dialog.setIcon(QMessageBox.Icon.Warning)
+                else:
+                    dialog.setWindowTitle("Export")
+                # Full lists of partmarks are shown under "Show Details..." of the dialog
+                sections = [
+                    ("Added", report.added), ("Changed", report.changed),
+                    ("Unchanged", report.unchanged), ("Not in the list", report.orphaned)
+                    ]
+                dialog.setDetailedText("\n\n".join(
+                    f"{title}:\n" + "\n".join(partmarks) for title, partmarks in sections if partmarks
+                    ))
+                dialog.exec()
+                # Opening file explorer is only available on Windows
+                if hasattr(os, "startfile"):
+                    os.startfile(output_directory)
     
+    def export_peddimat_archive(self):
+        partmarks = [self.part_list_widget.item(i).text() for i in range(self.part_list_widget.count())]
+
+        if partmarks:
+            caption = "select output archive"
+            archive_filter = "Archives (*.zip *.tar *.tar.gz)"
+            archive_path = QFileDialog.getSaveFileName(self, caption=caption, filter=archive_filter)[0]
+            if archive_path:
+                peddimat_encoder = PeddimatEncoder(self.database_connection)
+                sequence = self.sequence_holes_checkbox.isChecked()
+                report = peddimat_encoder.save_peddimat_archive(partmarks, archive_path, sequence=sequence)
+                if report.failed or sequence:
+                    lines = format_sequencing(report) if sequence else []
+                    if report.failed:
+                        lines.append(f"{len(report.failed)} of {len(partmarks)} part(s) could not be exported.")
+                        lines.extend(f"{partmark}: {error}" for partmark, error in list(report.failed.items())[:20])
+                    dialog = QMessageBox(self)
+                    dialog.setText("\n".join(lines))
+                    if report.failed:
+                        dialog.setWindowTitle("Export errors")
+                        dialog.setIcon(QMessageBox.Icon.Warning)
+                    else:
+                        dialog.setWindowTitle("Archive export")
+                    dialog.exec()
+
+    def export_peddimat_job(self):
+        partmarks = [self.part_list_widget.item(i).text() for i in range(self.part_list_widget.count())]
+
+        if partmarks:
+            output_directory = QFileDialog.getExistingDirectory(self, caption="select output directory")
+            if output_directory:
+                job_scheduler = JobScheduler(self.database_connection)
+                result = job_scheduler.save_job(partmarks, output_directory, assign_slots=True, numbered=True)
+                dialog = QMessageBox(self)
+                dialog.setText(
+                    f'{len(partmarks)} program(s) written in run order.\n'
+                    f'Tool changes: {result["tool_changes_before"]} in list order, {result["tool_changes_after"]} in run order.'
+                    )
+                dialog.setWindowTitle("Job export")
+                dialog.exec()
+
+    def open_session(self):
+        path = QFileDialog.getOpenFileName(self, caption="open session", filter="Session files (*.db)")[0]
+        if path:
+            self.database_connection.load_snapshot(path)
+            migrate_schema(self.database_connection)
+            self.populate_part_list_widget()
+            if self.part_list_widget.count():
+                self.part_list_widget.setCurrentItem(self.part_list_widget.item(0))
+
+    def save_session(self):
+        if self.part_list_widget.count():
+            path = QFileDialog.getSaveFileName(self, caption="save session", filter="Session files (*.db)")[0]
+            if path:
+                self.database_connection.save_snapshot(path)
+
     def closeEvent(self, event):
-        if os.path.exists(self.database_connection.database_file):
-            os.remove(self.database_connection.database_file)
+        if self.import_worker:
+            self.import_worker.requestInterruption()
+            self.import_worker.wait()
+        self.parse_cache.database_connection.close()
+        # In-memory session database is discarded when its last connection is closed
+        self.database_connection.close()
 
 
 def main():
     app = QApplication(sys.argv)
+    # Name of per-user cache directory
+    app.setApplicationName("DSTV-Peddimat Converter")
     window = MainWindow()
     app.exec()
 
@@ -1,6 +1,243 @@
-import sqlite3
-from db_controller import DatabaseConnection
+from db_controller import DatabaseConnection, PartDatabase, decoded_part_data
+from dstv_decoder import SteelPart, decode_many
 import os
+import time
+import json
+import hashlib
+import tempfile
+import io
+import csv
+import tarfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+
+# Version of Peddimat encoding rules, programs exported with other version are encoded again by incremental export
+ENCODER_VERSION = 1
+
+MANIFEST_FILE_NAME = "peddimat_manifest.json"
+
+
+def get_file_mode():
+    """Return permissions of newly created files under current umask, temporary files are created with 0600"""
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+# Read once, changing umask is not thread safe
+FILE_MODE = get_file_mode()
+
+
+def write_atomic(path, content):
+    """Write text file through temporary file in the same directory renamed over the target"""
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=".", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as file:
+            file.write(content)
+        os.chmod(temp_path, FILE_MODE)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def export_chunk(parts_data, dir_path):
+    """Encode and write Peddimat files of given parts, return list of (partmark, error message or None)"""
+    encoder = PeddimatEncoder(None)
+    results = []
+    for part_data in parts_data:
+        try:
+            write_atomic(os.path.join(dir_path, part_data["partmark"]), encoder.encode_part(part_data))
+            results.append((part_data["partmark"], None))
+        except Exception as error:
+            results.append((part_data["partmark"], f"{type(error).__name__}: {error}"))
+    return results
+
+
+def hash_program(peddimat_string):
+    return hashlib.blake2b(peddimat_string.encode(), digest_size=16).hexdigest()
+
+
+def sync_chunk(parts_data, dir_path, program_hashes):
+    """
+    Encode given parts and write only Peddimat files whose program differs from program_hashes or is missing.
+    Return list of (partmark, program hash, "added", "changed" or "unchanged", error message or None).
+    """
+    encoder = PeddimatEncoder(None)
+    results = []
+    for part_data in parts_data:
+        partmark = part_data["partmark"]
+        path = os.path.join(dir_path, partmark)
+        try:
+            peddimat_string = encoder.encode_part(part_data)
+            program_hash = hash_program(peddimat_string)
+            if program_hashes.get(partmark) == program_hash and os.path.exists(path):
+                results.append((partmark, program_hash, "unchanged", None))
+                continue
+            write_atomic(path, peddimat_string)
+            status = "changed" if partmark in program_hashes else "added"
+            results.append((partmark, program_hash, status, None))
+        except Exception as error:
+            results.append((partmark, None, None, f"{type(error).__name__}: {error}"))
+    return results
+
+
+def run_chunks(function, parts_data, args, workers, chunk_size):
+    """Yield results of function called with chunks of parts_data on a process pool, with limited number of chunks in flight"""
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        # Parts are read from database while workers encode
+        pending = set()
+        chunk = []
+        for part_data in parts_data:
+            chunk.append(part_data)
+            if len(chunk) == chunk_size:
+                pending.add(executor.submit(function, chunk, *args))
+                chunk = []
+            if len(pending) >= 2*workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        if chunk:
+            pending.add(executor.submit(function, chunk, *args))
+        for future in wait(pending).done:
+            yield future.result()
+
+
+def load_manifest(dir_path):
+    """Return manifest of previous export to dir_path, empty manifest if there is none or it can not be read"""
+    try:
+        with open(os.path.join(dir_path, MANIFEST_FILE_NAME)) as file:
+            manifest = json.load(file)
+        if isinstance(manifest.get("programs"), dict):
+            return manifest
+    except (OSError, ValueError, AttributeError):
+        pass
+    return {"encoder_version": None, "programs": {}}
+
+
+def sequence_holes(holes):
+    """
+    Return holes ordered for the drill line: by tool slot, then sweeping along X.
+    Front, bottom and top spindles hold their own tools, so holes of the same tool slot on all surfaces
+    are drilled in one sweep. Sweep direction starts from the end closer to the carriage position,
+    tool slots follow first appearance of hole sizes on each surface, so the tool table does not change.
+    """
+    slots = {}
+    slot_counts = {}
+    groups = {}
+    for hole in holes:
+        key = (hole["surface"], hole["size"])
+        if key not in slots:
+            slots[key] = slot_counts.get(hole["surface"], 0)
+            slot_counts[hole["surface"]] = slots[key] + 1
+        groups.setdefault(slots[key], []).append(hole)
+
+    sequenced = []
+    position = 0
+    for slot in sorted(groups):
+        group = sorted(groups[slot], key=lambda hole: hole["x_distance"])
+        if abs(group[-1]["x_distance"] - position) < abs(group[0]["x_distance"] - position):
+            group.reverse()
+        sequenced.extend(group)
+        position = group[-1]["x_distance"]
+    return sequenced
+
+
+def carriage_travel(holes):
+    """Return estimated carriage travel along X, in x_distance units, when drilling holes in given order from X 0"""
+    travel = 0
+    position = 0
+    for hole in holes:
+        travel += abs(hole["x_distance"] - position)
+        position = hole["x_distance"]
+    return travel
+
+
+def tool_changes(holes):
+    """Return number of tool changes of all spindles when drilling holes in given order"""
+    changes = 0
+    spindle_tools = {}
+    for hole in holes:
+        if spindle_tools.setdefault(hole["surface"], hole["size"]) != hole["size"]:
+            spindle_tools[hole["surface"]] = hole["size"]
+            changes += 1
+    return changes
+
+
+def sequence_parts(parts_data, report):
+    """Yield part data with sequenced holes, adding carriage travel and tool changes before and after sequencing to report"""
+    for part_data in parts_data:
+        holes = sequence_holes(part_data["holes"])
+        report.travel_before += carriage_travel(part_data["holes"])
+        report.travel_after += carriage_travel(holes)
+        report.tool_changes_before += tool_changes(part_data["holes"])
+        report.tool_changes_after += tool_changes(holes)
+        yield dict(part_data, holes=holes)
+
+
+def convert_dstv_files(paths, dir_path="", profile_types=("B", "C", "T", "t"), workers=None, sequence=False):
+    """
+    Decode DSTV files and write their Peddimat files without session database.
+    Decoded parts stream through chained generators, output is the same as export of imported parts.
+    Parts with incorrect DSTV format or profile type not in profile_types are skipped.
+    With workers 1 files are decoded lazily in current process and holes are streamed by SteelPart.iter_holes.
+    With sequence holes are ordered by sequence_holes.
+    Return ExportReport.
+    """
+    report = ExportReport()
+    start_time = time.perf_counter()
+    if workers == 1:
+        records = (SteelPart(path, lazy=True) for path in paths)
+    else:
+        records = decode_many(paths, workers, profile_types=profile_types)
+    parts = (record for record in records if record.correct_dstv_format and record.profile_type in profile_types)
+    parts_data = (decoded_part_data(part) for part in parts)
+    if sequence:
+        parts_data = sequence_parts(parts_data, report)
+    for data in parts_data:
+        report.add_results(export_chunk([data], dir_path))
+    report.elapsed = time.perf_counter() - start_time
+    return report
+
+
+class ExportReport:
+    """A class to store result of batch export of Peddimat files"""
+    def __init__(self):
+        self.written = []
+        self.failed = {}
+        self.elapsed = 0.0
+        self.travel_before = 0
+        self.travel_after = 0
+        self.tool_changes_before = 0
+        self.tool_changes_after = 0
+
+    def add_results(self, results):
+        for partmark, error in results:
+            if error is None:
+                self.written.append(partmark)
+            else:
+                self.failed[partmark] = error
+
+    @property
+    def parts_per_second(self):
+        parts = len(self.written) + len(self.failed)
+        return parts/self.elapsed if self.elapsed else 0.0
+
+
+class SyncReport(ExportReport):
+    """A class to store result of incremental export, orphaned are programs in manifest of parts not exported any more"""
+    def __init__(self):
+        super().__init__()
+        self.added = []
+        self.changed = []
+        self.unchanged = []
+        self.orphaned = []
+
+    @property
+    def parts_per_second(self):
+        parts = len(self.written) + len(self.failed) + len(self.unchanged)
+        return parts/self.elapsed if self.elapsed else 0.0
 
 
 class PeddimatEncoder:
@@ -10,29 +247,178 @@ class PeddimatEncoder:
     def save_peddimat_file(self, partmark, dir_path=""):
         peddimat_string = self.build_peddimat_string(partmark)
         path = os.path.join(dir_path, partmark)
-        with open(path, "w") as file:
-            file.write(peddimat_string)
+        write_atomic(path, peddimat_string)
+
+    def save_peddimat_files(self, partmarks, dir_path="", workers=None, chunk_size=32, sequence=False):
+        """
+        Encode and atomically write Peddimat files of given parts on a process pool.
+        Failed parts do not stop the export, they are listed in returned ExportReport.
+        Parameters:
+        workers : int
+            number of worker processes, defaults to number of CPUs; with 1 parts are encoded in current process
+        chunk_size : int
+            number of parts encoded by a worker in a single task,
+            exports not larger than single chunk are encoded in current process
+        sequence : bool
+            order holes by sequence_holes, total carriage travel and tool changes before and after are added to report
+        """
+        report = ExportReport()
+        start_time = time.perf_counter()
+        parts_data = PartDatabase(self.database_connection).iter_parts(partmarks)
+        if sequence:
+            parts_data = sequence_parts(parts_data, report)
+        if workers is None:
+            workers = os.cpu_count() or 1
+
+        if workers <= 1 or len(partmarks) <= chunk_size:
+            for part_data in parts_data:
+                report.add_results(export_chunk([part_data], dir_path))
+        else:
+            for results in run_chunks(export_chunk, parts_data, (dir_path,), workers, chunk_size):
+                report.add_results(results)
+
+        report.elapsed = time.perf_counter() - start_time
+        return report
+
+    def sync_peddimat_files(self, partmarks, dir_path="", workers=None, chunk_size=32, sequence=False):
+        """
+        Incremental export keeping manifest of source and program hashes in dir_path.
+        Parts with unchanged DSTV file exported by the same ENCODER_VERSION are not encoded,
+        other parts are encoded and their files are written only if the program changed,
+        so unchanged files keep their modification time. Orphaned programs are reported, not removed.
+        Return SyncReport, parameters as in save_peddimat_files.
+        """
+        report = SyncReport()
+        start_time = time.perf_counter()
+        manifest = load_manifest(dir_path)
+        old_programs = manifest["programs"]
+        same_encoder = manifest["encoder_version"] == ENCODER_VERSION and manifest.get("sequence", False) == sequence
+        source_hashes = PartDatabase(self.database_connection).get_source_hashes()
+        if workers is None:
+            workers = os.cpu_count() or 1
+
+        programs = {}
+        stale = []
+        for partmark in partmarks:
+            entry = old_programs.get(partmark)
+            source_hash = source_hashes.get(partmark)
+            if (same_encoder and entry and source_hash is not None and entry["source"] == source_hash
+                    and os.path.exists(os.path.join(dir_path, partmark))):
+                programs[partmark] = entry
+                report.unchanged.append(partmark)
+            else:
+                stale.append(partmark)
+
+        program_hashes = {partmark: old_programs[partmark]["program"] for partmark in stale if partmark in old_programs}
+        parts_data = PartDatabase(self.database_connection).iter_parts(stale)
+        if sequence:
+            parts_data = sequence_parts(parts_data, report)
+        if workers <= 1 or len(stale) <= chunk_size:
+            results = (sync_chunk([part_data], dir_path, program_hashes) for part_data in parts_data)
+        else:
+            results = run_chunks(sync_chunk, parts_data, (dir_path, program_hashes), workers, chunk_size)
+        for chunk_results in results:
+            for partmark, program_hash, status, error in chunk_results:
+                if error is not None:
+                    report.failed[partmark] = error
+                    continue
+                programs[partmark] = {"source": source_hashes.get(partmark), "program": program_hash}
+                getattr(report, status).append(partmark)
+        report.written = report.added + report.changed
+
+        # Programs of parts removed from the job stay listed while their files exist
+        exported = set(partmarks)
+        for partmark, entry in old_programs.items():
+            if partmark not in exported and os.path.exists(os.path.join(dir_path, partmark)):
+                programs[partmark] = entry
+                report.orphaned.append(partmark)
+
+        manifest = {"encoder_version": ENCODER_VERSION, "sequence": sequence, "programs": programs}
+        write_atomic(os.path.join(dir_path, MANIFEST_FILE_NAME), json.dumps(manifest, indent=1, sort_keys=True))
+        report.elapsed = time.perf_counter() - start_time
+        return report
     
+    def save_peddimat_archive(self, partmarks, archive_path, sequence=False):
+        """
+        Encode Peddimat programs of given parts straight into single zip or tar archive with manifest.csv
+        listing partmark, quantity and hole count. Archive type follows extension (.zip, .tar, .tar.gz, .tgz),
+        archive is written through one temporary file renamed over the target when complete.
+        Failed parts are skipped and listed in returned ExportReport. With sequence holes are ordered by sequence_holes.
+        """
+        report = ExportReport()
+        start_time = time.perf_counter()
+        manifest = io.StringIO()
+        manifest_writer = csv.writer(manifest, lineterminator="\n")
+        manifest_writer.writerow(["partmark", "quantity", "holes"])
+
+        dir_path = os.path.dirname(archive_path) or "."
+        fd, temp_path = tempfile.mkstemp(dir=dir_path, prefix=".", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                if archive_path.lower().endswith(".zip"):
+                    archive = zipfile.ZipFile(file, "w", compression=zipfile.ZIP_DEFLATED)
+                    add_entry = archive.writestr
+                else:
+                    mode = "w:gz" if archive_path.lower().endswith((".tar.gz", ".tgz")) else "w"
+                    archive = tarfile.open(fileobj=file, mode=mode)
+                    def add_entry(name, content):
+                        data = content.encode()
+                        info = tarfile.TarInfo(name)
+                        info.size = len(data)
+                        info.mtime = int(time.time())
+                        archive.addfile(info, io.BytesIO(data))
+
+                parts_data = PartDatabase(self.database_connection).iter_parts(partmarks)
+                if sequence:
+                    parts_data = sequence_parts(parts_data, report)
+                with archive:
+                    for part_data in parts_data:
+                        try:
+                            peddimat_string = self.encode_part(part_data)
+                        except Exception as error:
+                            report.failed[part_data["partmark"]] = f"{type(error).__name__}: {error}"
+                            continue
+                        add_entry(part_data["partmark"], peddimat_string)
+                        manifest_writer.writerow([part_data["partmark"], part_data["quantity"], len(part_data["holes"])])
+                        report.written.append(part_data["partmark"])
+                    add_entry("manifest.csv", manifest.getvalue())
+            os.chmod(temp_path, FILE_MODE)
+            os.replace(temp_path, archive_path)
+        except BaseException:
+            os.remove(temp_path)
+            raise
+
+        report.elapsed = time.perf_counter() - start_time
+        return report
+
     def build_peddimat_string(self, partmark):
         part_data = self.load_part_data(partmark)
+        return self.encode_part(part_data)
+
+    def encode_part(self, part_data, tools=None):
+        """Return Peddimat string of part, tools is list of (front, bottom, top) tool slots, by default built from holes"""
         rows = []
 
         rows.append(part_data["partmark"])
         rows.append(part_data["profile"])
         rows.append(part_data["profile_type"])
         
+        # Tool table is built once per part and shared by tool row and all hole rows
+        if tools is None:
+            tools = self.get_tools(part_data)
+        tool_numbers = self.get_tool_numbers(tools)
+
         profile_info_row = self.build_profile_info_row(part_data)
-        tool_info_row = self.build_tool_row(partmark)
+        tool_info_row = self.build_tool_row(tools)
         profile_and_tool_row = profile_info_row + tool_info_row
 
         rows.append(profile_and_tool_row)
 
-        hole_quantity_row = self.build_hole_quantity_row(partmark)
+        hole_quantity_row = self.build_hole_quantity_row(part_data)
         rows.append(hole_quantity_row)
 
-        holes_data = self.load_holes_data(partmark)
-        for hole in holes_data:
-            hole_row = self.build_hole_row(hole, partmark)
+        for hole in part_data["holes"]:
+            hole_row = self.build_hole_row(hole, tool_numbers)
             rows.append(hole_row)
         
         rows.append("")
@@ -51,99 +437,44 @@ class PeddimatEncoder:
         row = f' {profile_info_string}  0  0  0  {part_data["length"]}'
         return row
     
-    def get_part_id(self, partmark):
-        connection = self.database_connection.connect()
-        cursor = connection.cursor()
-        cursor.execute("SELECT PartId FROM part WHERE partmark = ?", (partmark,))
-        part_id = cursor.fetchone()[0]
-        return part_id
-    
     def load_part_data(self, partmark):
-        connection = self.database_connection.connect()
-        connection.row_factory = sqlite3.Row
-        cursor = connection.cursor()
-        query = """SELECT
-        partmark,
-        profile,
-        profile_type,
-        quantity,
-        profile_depth,
-        web_thickness,
-        flange_height,
-        flange_thickness,
-        length
-        FROM part WHERE partmark = ?
-        """
-        cursor.execute(query, (partmark,))
-        part_data = dict(cursor.fetchone())
+        part_database = PartDatabase(self.database_connection)
+        part_data = part_database.load_parts([partmark])[0]
         return part_data
     
-    def get_tools(self, partmark):
-        tools = zip(self.load_tools(partmark, "front"), self.load_tools(partmark, "bottom"), self.load_tools(partmark, "top"))
+    def get_tools(self, part_data):
+        tools = zip(self.load_tools(part_data, "front"), self.load_tools(part_data, "bottom"), self.load_tools(part_data, "top"))
         return list(tools)
 
-    def build_tool_row(self, partmark):
-        tools = self.get_tools(partmark)
+    def build_tool_row(self, tools):
         tool_string = ""
         for tool in tools:
             for surface in tool:
                 tool_string += f"  {surface}"
         return tool_string
     
-    def load_tools(self, partmark, surface):
-        connection = self.database_connection.connect()
-        cursor = connection.cursor()
-        part_id = self.get_part_id(partmark)
-        cursor.execute("SELECT size FROM hole WHERE PartId = ? AND surface = ?", (part_id, surface))
+    def load_tools(self, part_data, surface):
         tools = []
-        [tools.append(row[0]) for row in cursor.fetchall() if row[0] not in tools]
+        [tools.append(hole["size"]) for hole in part_data["holes"] if hole["surface"] == surface and hole["size"] not in tools]
         while len(tools) < 9:
             tools.append("0")
         return tools
     
-    def build_hole_quantity_row(self, partmark):
-        holes_data = self.load_holes_data(partmark)
-        quantity = len(holes_data)+1
+    def build_hole_quantity_row(self, part_data):
+        quantity = len(part_data["holes"])+1
         row = f" {quantity}"
         return row
     
-    def load_holes_data(self, partmark):
-        connection = self.database_connection.connect()
-        connection.row_factory = sqlite3.Row
-        cursor = connection.cursor()
-        part_id = self.get_part_id(partmark)
-
-        query = """SELECT
-        surface,
-        diameter,
-        slotted,
-        slot_x,
-        slot_y,
-        size,
-        x_distance,
-        y_distance
-        FROM hole WHERE PartId = ?
-        """
-        cursor.execute(query, (part_id,))
-        result = cursor.fetchall()
-        hole_data_list = [dict(hole_data) for hole_data in result]
-        return hole_data_list
-    
-    def get_tool_number(self, partmark, size, surface):
-        tool_row = self.get_tools(partmark)
-        match surface:
-            case "front":
-                surface_index = 1
-            case "bottom":
-                surface_index = 2
-            case "top":
-                surface_index = 3
-        for i in range(9):
-            if tool_row[i][surface_index-1] == size:
-                return f"{surface_index}0{i+1}0"
+    def get_tool_numbers(self, tools):
+        """Return dictionary from (surface, size) to tool number, first of 9 tool slots with given size is used"""
+        tool_numbers = {}
+        for i, tool in enumerate(tools[:9]):
+            for surface_index, surface in enumerate(("front", "bottom", "top"), start=1):
+                tool_numbers.setdefault((surface, tool[surface_index-1]), f"{surface_index}0{i+1}0")
+        return tool_numbers
     
-    def build_hole_row(self, hole_data, partmark):
-        tool_number = self.get_tool_number(partmark, hole_data["size"], hole_data["surface"])
+    def build_hole_row(self, hole_data, tool_numbers):
+        tool_number = tool_numbers.get((hole_data["surface"], hole_data["size"]))
         row = f' {hole_data["x_distance"]}  {hole_data["y_distance"]}.{tool_number}'
         return row
 
@@ -0,0 +1,126 @@
+import os
+import glob
+import random
+from types import SimpleNamespace
+
+import pytest
+
+from db_controller import DatabaseConnection, PartDatabase, migrate_schema
+from dstv_decoder import SteelPart, HoleTable, decode_part, hash_dstv
+from peddimat_encoder import PeddimatEncoder, convert_dstv_files
+
+
+BASEDIR = os.path.dirname(__file__)
+DSTV_PATHS = sorted(glob.glob(os.path.join(BASEDIR, "sample_dstv_files", "*.nc1")))
+PEDDIMAT_DIR = os.path.join(BASEDIR, "sample_peddimat_files")
+MEMORY_TEST_URI = "file:test_session?mode=memory&cache=shared"
+
+
+def scalar_hole(hole_line, profile_type, profile_depth):
+    """Per-hole float calculation of hole geometry used before batch transform of HoleTable"""
+    if profile_type == "t":
+        surface = {"v": "top", "o": "front"}.get(hole_line[0])
+    else:
+        surface = {"v": "front", "o": "top", "u": "bottom"}[hole_line[0]]
+
+    diameter = float(hole_line[3])*10
+    if len(hole_line) == 4:
+        slot_x = 0
+        slot_y = 0
+        size = str(round(diameter))
+        size_mm = str(round(diameter/10, 1))
+        size_inch = str(round(diameter/254, 3))
+    else:
+        slot_x = float(hole_line[5])*10
+        slot_y = float(hole_line[6])*10
+        size = f"{round(diameter+slot_x)}X{round(diameter+slot_y)}"
+        size_mm = f"{round((diameter+slot_x)/10, 1)}X{round((diameter+slot_y)/10, 1)}"
+        size_inch = f"{round((diameter+slot_x)/254, 3)}X{round((diameter+slot_y)/254, 3)}"
+
+    type_string = hole_line[2]
+    if "m" in type_string and "g" not in type_string and "l" not in type_string:
+        diameter = 0
+        size = "0"
+    if type_string[-1] in "glm":
+        type_string = type_string[:-1]
+
+    x_distance = float(hole_line[1][:-1])*1000 + 100*slot_x/2
+    if surface == "front" and profile_type == "t":
+        y_distance = float(type_string)*1000 - 100*slot_y/2
+    elif surface == "front":
+        y_distance = profile_depth*100 - float(type_string)*1000 + 100*slot_y/2
+    else:
+        y_distance = float(type_string)*1000 - 100*slot_y*50/2
+    return (surface, diameter, slot_x, slot_y, size, size_mm, size_inch, x_distance, y_distance)
+
+
+def batch_hole(hole):
+    return (
+        hole.surface, hole.diameter, hole.slot_x, hole.slot_y, hole.size,
+        hole.size_mm, hole.size_inch, hole.x_distance, hole.y_distance
+        )
+
+
+def random_hole_line(rng, profile_type):
+    decimals = rng.randint(0, 3)
+    def value(maximum):
+        return f"{rng.randint(0, maximum*10**decimals)/10**decimals:.{decimals}f}"
+
+    surface = rng.choice("ov" if profile_type == "t" else "ovu")
+    hole_line = [surface, value(15000) + "s", value(600) + rng.choice(["", "", "g", "l", "m"]), value(40)]
+    if rng.random() < 0.3:
+        hole_line += ["0.00l", value(50), value(50), "0.00"]
+    return hole_line
+
+
+@pytest.mark.parametrize("path", DSTV_PATHS, ids=os.path.basename)
+def test_batch_transform_matches_scalar_on_samples(path):
+    part = SteelPart(path)
+    holes_lines = part.get_holes_lines()
+    assert len(holes_lines) == len(part.holes)
+    for hole_line, hole in zip(holes_lines, part.holes):
+        assert batch_hole(hole) == scalar_hole(hole_line, part.profile_type, part.profile_depth)
+
+
+@pytest.mark.parametrize("profile_type", ["B", "C", "T", "t"])
+def test_batch_transform_matches_scalar_on_random_rows(profile_type):
+    rng = random.Random(profile_type)
+    part = SimpleNamespace(partmark="X", profile_type=profile_type, profile_depth=float("3045.8")*10)
+    holes_lines = [random_hole_line(rng, profile_type) for i in range(2000)]
+    table = HoleTable(part, holes_lines)
+    for hole_line, hole in zip(holes_lines, table):
+        assert batch_hole(hole) == scalar_hole(hole_line, part.profile_type, part.profile_depth), hole_line
+
+
+@pytest.mark.parametrize("path", DSTV_PATHS, ids=os.path.basename)
+def test_decode_with_hash_matches_decode_from_file(path):
+    record = decode_part(path, with_hash=True)
+    expected = decode_part(path)
+    with open(path, "rb") as file:
+        assert record.content_hash == hash_dstv(path, file.read())
+    assert [batch_hole(hole) for hole in record.holes] == [batch_hole(hole) for hole in expected.holes]
+    assert (record.partmark, record.profile, record.length) == (expected.partmark, expected.profile, expected.length)
+
+
+def test_database_export_matches_sample_peddimat_files():
+    database_connection = DatabaseConnection(MEMORY_TEST_URI)
+    migrate_schema(database_connection)
+    part_database = PartDatabase(database_connection)
+    partmarks = part_database.insert_parts(SteelPart(path) for path in DSTV_PATHS)
+    encoder = PeddimatEncoder(database_connection)
+    try:
+        for partmark in partmarks:
+            with open(os.path.join(PEDDIMAT_DIR, partmark)) as file:
+                assert encoder.build_peddimat_string(partmark) == file.read()
+    finally:
+        database_connection.close()
+
+
+def test_direct_conversion_matches_sample_peddimat_files(tmp_path):
+    report = convert_dstv_files(DSTV_PATHS, str(tmp_path), workers=1)
+    assert not report.failed
+    assert len(report.written) == len(DSTV_PATHS)
+    for partmark in report.written:
+        with open(os.path.join(PEDDIMAT_DIR, partmark)) as expected, open(tmp_path / partmark) as written:
+            assert written.read() == expected.read()
+